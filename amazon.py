@@ -1,17 +1,26 @@
+import asyncio
 import csv
 from datetime import datetime, timedelta
 import os
-from typing import Dict
+from typing import Dict, Optional
 from collections import defaultdict
 import logging
 import argparse
 import sys
 
 from dotenv import load_dotenv
-from lunchable import TransactionUpdateObject
+from lunchable import LunchMoney, TransactionUpdateObject
 
 from deepinfra import get_suggested_category_id
-from lunch import get_lunch_client
+from lunch import (
+    AsyncLunchClient,
+    get_async_lunch_client,
+    get_async_lunch_client_for_chat_id,
+    get_lunch_client,
+    get_lunch_client_for_chat_id,
+    update_transaction_async,
+)
+from rate_limiter import BACKGROUND, priority_lane
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger("amz")
@@ -125,35 +134,84 @@ def get_amazon_transactions_summary(file_path: str):
     return summary
 
 
-def process_amazon_transactions(
+# bulk processing must not get in the way of button presses
+async def process_amazon_transactions(
     file_path: str,
     days_back: int,
     dry_run: bool,
     allow_days: int,
     auto_categorize: True,
+    chat_id: Optional[int] = None,
 ) -> dict:
-    load_dotenv()
-    token = os.getenv("LUNCH_MONEY_TOKEN")
-    if not token:
-        logger.error("LUNCH_MONEY_TOKEN environment variable not set")
-        sys.exit(1)
-
-    lunch = get_lunch_client(token)
-    categories = lunch.get_categories()
+    """Matches the Lunch Money transactions against the Amazon export and adds
+    the product names as notes. Uses the chat's Lunch Money clients if given a
+    chat_id, or the LUNCH_MONEY_TOKEN otherwise (e.g. from the command line)."""
+    with priority_lane(BACKGROUND):
+        if chat_id is not None:
+            lunch = await asyncio.to_thread(get_lunch_client_for_chat_id, chat_id)
+            async_lunch = await get_async_lunch_client_for_chat_id(chat_id)
+            return await _process_amazon_transactions(
+                lunch,
+                async_lunch,
+                file_path,
+                days_back,
+                dry_run,
+                allow_days,
+                auto_categorize,
+                chat_id,
+            )
+
+        load_dotenv()
+        token = os.getenv("LUNCH_MONEY_TOKEN")
+        if not token:
+            logger.error("LUNCH_MONEY_TOKEN environment variable not set")
+            sys.exit(1)
+
+        lunch = get_lunch_client(token)
+        # the client holds an HTTP session, closed once the run is over
+        async with get_async_lunch_client(token) as async_lunch:
+            return await _process_amazon_transactions(
+                lunch,
+                async_lunch,
+                file_path,
+                days_back,
+                dry_run,
+                allow_days,
+                auto_categorize,
+            )
+
+
+async def _process_amazon_transactions(
+    lunch: LunchMoney,
+    async_lunch: AsyncLunchClient,
+    file_path: str,
+    days_back: int,
+    dry_run: bool,
+    allow_days: int,
+    auto_categorize: True,
+    chat_id: Optional[int] = None,
+) -> dict:
+    categories = await async_lunch.get_categories()
     today = datetime.now()
     today = today.replace(hour=0, minute=0, second=0, microsecond=0)
 
     start_date = today - timedelta(days=days_back)
     start_date = start_date.replace(hour=0, minute=0, second=0, microsecond=0)
-    amz = lunch.get_transactions(start_date=start_date, end_date=today)
+
+    # stream the range, since it can be a whole year, and keep only Amazon's
+    pulled = 0
+    amz = []
+    async for a in async_lunch.iter_transactions(start_date=start_date, end_date=today):
+        pulled += 1
+        if a.payee == "Amazon" and a.amount > 0:
+            amz.append(a)
 
     logger.info(
         "Pulled transactions for range %s to %s, got %d transactions",
         start_date,
         today,
-        len(amz),
+        pulled,
     )
-    amz = [a for a in amz if a.payee == "Amazon" and a.amount > 0]
 
     amz_cnt = len(amz)
     found_cnt = 0
@@ -190,8 +248,13 @@ def process_amazon_transactions(
 
             product_name = found["Product Name"]
             if auto_categorize:
-                _, cat_id = get_suggested_category_id(
-                    tx_id=a.id, lunch=lunch, override_notes=product_name
+                _, cat_id = await asyncio.to_thread(
+                    get_suggested_category_id,
+                    tx_id=a.id,
+                    lunch=lunch,
+                    override_notes=product_name,
+                    transaction=a,
+                    categories=categories,
                 )
                 # make sure the category exists, since LLMs hallucinate
                 if cat_id not in [c.id for c in categories]:
@@ -203,14 +266,16 @@ def process_amazon_transactions(
                 if len(product_name) > 350:
                     product_name = product_name[:350]
 
-                logger.info(
-                    lunch.update_transaction(
-                        a.id,
-                        TransactionUpdateObject(
-                            notes=product_name, category_id=category_id
-                        ),
-                    )
+                update = TransactionUpdateObject(
+                    notes=product_name, category_id=category_id
                 )
+                if chat_id is not None:
+                    # publishes TransactionUpdated, so the chat's cached
+                    # transactions and budgets are refreshed
+                    response = await update_transaction_async(chat_id, a.id, update)
+                else:
+                    response = await async_lunch.update_transaction(a.id, update)
+                logger.info(response)
             category_name = [c.name for c in categories if c.id == category_id]
             category_name = category_name[0] if category_name else None
             report["updates"].append(
@@ -270,11 +335,13 @@ if __name__ == "__main__":
         default=False,
     )
     args = parser.parse_args()
-    result = process_amazon_transactions(
-        args.file_path,
-        args.days_back,
-        args.dry_run,
-        args.allow_days,
-        args.auto_categorize,
+    result = asyncio.run(
+        process_amazon_transactions(
+            args.file_path,
+            args.days_back,
+            args.dry_run,
+            args.allow_days,
+            args.auto_categorize,
+        )
     )
     print(result)
@@ -0,0 +1,139 @@
+import re
+import threading
+from contextvars import ContextVar
+from functools import wraps
+from typing import Dict, List, Optional, Tuple
+from urllib.parse import urlsplit
+
+# upper bounds of the latency histogram buckets, in milliseconds
+LATENCY_BUCKETS_MS = (50, 100, 250, 500, 1000, 2500, 5000, float("inf"))
+
+# name of the handler (or job) the current API calls are made on behalf of
+current_handler: ContextVar[str] = ContextVar("current_handler", default="other")
+
+
+def track_handler(callback):
+    """Attributes the API calls made while the callback runs, including from the
+    tasks it spawns, to the callback."""
+    name = callback.__name__
+
+    @wraps(callback)
+    async def wrapper(*args, **kwargs):
+        reset_token = current_handler.set(name)
+        try:
+            return await callback(*args, **kwargs)
+        finally:
+            current_handler.reset(reset_token)
+
+    return wrapper
+
+
+def endpoint_name(method: str, url: str) -> str:
+    """Returns e.g. "PUT /transactions/:id" for .../v1/transactions/1234"""
+    path = urlsplit(str(url)).path
+    path = re.sub(r"^/v\d+", "", path)
+    path = re.sub(r"/\d+(?=/|$)", "/:id", path)
+    return f"{method} {path}"
+
+
+class CallStats:
+    def __init__(self):
+        self.calls = 0
+        self.errors = 0
+        self.total_ms = 0.0
+        self.buckets = [0] * len(LATENCY_BUCKETS_MS)
+
+    def add(self, elapsed_ms: float, error: bool) -> None:
+        self.calls += 1
+        self.errors += int(error)
+        self.total_ms += elapsed_ms
+        for i, upper_bound in enumerate(LATENCY_BUCKETS_MS):
+            if elapsed_ms <= upper_bound:
+                self.buckets[i] += 1
+                break
+
+    def percentile(self, p: float) -> float:
+        """Upper bound of the bucket the p-th percentile falls in."""
+        seen = 0
+        for count, upper_bound in zip(self.buckets, LATENCY_BUCKETS_MS):
+            seen += count
+            if seen >= p * self.calls:
+                return upper_bound
+        return LATENCY_BUCKETS_MS[-1]
+
+    def describe(self) -> str:
+        if not self.calls:
+            return "no calls"
+
+        def bound(p: float) -> str:
+            value = self.percentile(p)
+            return f"≤{value:.0f}ms" if value != float("inf") else ">5s"
+
+        return (
+            f"{self.calls} calls, {self.errors} errors, "
+            f"avg {self.total_ms / self.calls:.0f}ms, "
+            f"p50 {bound(0.5)}, p95 {bound(0.95)}"
+        )
+
+
+class ApiMetrics:
+    """Call counts, error counts and latency histograms of API round trips,
+    per endpoint and per calling handler, since the bot started."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.by_endpoint: Dict[str, CallStats] = {}
+        # handler -> endpoint -> stats
+        self.by_handler: Dict[str, Dict[str, CallStats]] = {}
+
+    def record(self, method: str, url: str, elapsed_secs: float, error: bool) -> None:
+        endpoint = endpoint_name(method, url)
+        handler = current_handler.get()
+        with self._lock:
+            self.by_endpoint.setdefault(endpoint, CallStats()).add(
+                elapsed_secs * 1000, error
+            )
+            self.by_handler.setdefault(handler, {}).setdefault(
+                endpoint, CallStats()
+            ).add(elapsed_secs * 1000, error)
+
+    def endpoints(self) -> List[Tuple[str, CallStats]]:
+        with self._lock:
+            return sorted(self.by_endpoint.items(), key=lambda e: -e[1].calls)
+
+    def handlers(self) -> List[Tuple[str, Dict[str, CallStats]]]:
+        with self._lock:
+            handlers = [(h, dict(stats)) for h, stats in self.by_handler.items()]
+        return sorted(handlers, key=lambda h: -sum(s.calls for s in h[1].values()))
+
+    def summary(self, max_handlers: int = 10, max_chars: Optional[int] = None) -> str:
+        """Human readable report; when max_chars is given, the report is cut
+        at a line boundary so that it fits in that many characters."""
+        endpoints = self.endpoints()
+        if not endpoints:
+            return "No API calls yet."
+
+        lines = ["By endpoint:"]
+        for endpoint, stats in endpoints:
+            lines.append(f"  {endpoint}: {stats.describe()}")
+
+        lines.append("By handler:")
+        for handler, stats in self.handlers()[:max_handlers]:
+            calls = sum(s.calls for s in stats.values())
+            errors = sum(s.errors for s in stats.values())
+            lines.append(f"  {handler}: {calls} calls, {errors} errors")
+            for endpoint, endpoint_stats in sorted(
+                stats.items(), key=lambda e: -e[1].calls
+            ):
+                lines.append(f"    {endpoint} x{endpoint_stats.calls}")
+
+        summary = "\n".join(lines)
+        if max_chars is None or len(summary) <= max_chars:
+            return summary
+        ellipsis = "\n  ..."
+        summary = summary[: max(max_chars - len(ellipsis), 0)]
+        summary = summary[: summary.rfind("\n")] if "\n" in summary else ""
+        return summary + ellipsis
+
+
+lunch_api_metrics = ApiMetrics()
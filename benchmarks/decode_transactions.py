@@ -0,0 +1,65 @@
+"""Compares decoding GET /transactions pages into lunchable models, the way
+get_transactions does, against the TransactionRecords used on the poll path.
+
+    python benchmarks/decode_transactions.py [--sizes 1000 10000] [--repeat 5]
+"""
+
+import argparse
+import json
+import os
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from lunchable.models.transactions import _TransactionsResponse  # noqa: E402
+
+from fake_lunch import FakeAccount  # noqa: E402
+from transaction_records import decode_transactions_page  # noqa: E402
+
+
+def decode_models(content: bytes):
+    return _TransactionsResponse.model_validate(json.loads(content)).transactions
+
+
+def decode_records(content: bytes):
+    return decode_transactions_page(content)[0]
+
+
+def measure(decode, content: bytes, repeat: int):
+    best = float("inf")
+    for _ in range(repeat):
+        started_at = time.perf_counter()
+        decode(content)
+        best = min(best, time.perf_counter() - started_at)
+
+    tracemalloc.start()
+    decoded = decode(content)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del decoded
+    return best, peak
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1000, 10000])
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    print(f"{'transactions':>12} {'decoder':>8} {'best time':>10} {'peak memory':>12}")
+    for size in args.sizes:
+        account = FakeAccount("benchmark", transactions=size, days=365)
+        content = json.dumps(
+            {"transactions": list(account.transactions.values()), "has_more": False}
+        ).encode()
+        for name, decode in (("models", decode_models), ("records", decode_records)):
+            elapsed, peak = measure(decode, content, args.repeat)
+            print(
+                f"{size:>12} {name:>8} {elapsed * 1000:>8.1f}ms {peak / 1024 / 1024:>10.1f}MB"
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,86 @@
+"""Measures commit throughput of the bot's small writes under each SQLite
+profile (see SQLITE_PROFILES in persistence.py), alone and with readers.
+
+    python benchmarks/sqlite_commits.py [--commits 1000] [--readers 2] [--dir /tmp]
+"""
+
+import argparse
+import os
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from persistence import SQLITE_PROFILES, Persistence  # noqa: E402
+
+
+def write(db: Persistence, commits: int) -> float:
+    started_at = time.perf_counter()
+    for i in range(commits):
+        # the writes made for every transaction sent and every button press
+        if i % 2:
+            db.mark_as_sent(tx_id=i, chat_id=1, message_id=i, recurring_type=None)
+        else:
+            db.mark_as_reviewed(message_id=i - 1, chat_id=1)
+    return commits / (time.perf_counter() - started_at)
+
+
+def read_until(db: Persistence, stop: threading.Event, counts: list, errors: list):
+    reads = 0
+    while not stop.is_set():
+        try:
+            db.get_message_id_associated_with(tx_id=reads % 100, chat_id=1)
+            db.get_current_settings(1)
+            reads += 1
+        except Exception as e:
+            errors.append(e)
+    counts.append(reads)
+
+
+def run(profile: str, commits: int, readers: int, directory: str):
+    with tempfile.TemporaryDirectory(dir=directory) as tmp:
+        db = Persistence(os.path.join(tmp, "bench.db"), sqlite_profile=profile)
+        db.save_token(1, "token")
+        alone = write(db, commits)
+
+        stop = threading.Event()
+        counts, errors = [], []
+        threads = [
+            threading.Thread(target=read_until, args=(db, stop, counts, errors))
+            for _ in range(readers)
+        ]
+        for thread in threads:
+            thread.start()
+        write_errors = 0
+        try:
+            contended = write(db, commits)
+        except Exception:
+            contended, write_errors = 0.0, 1
+        stop.set()
+        for thread in threads:
+            thread.join()
+        db.engine.dispose()
+    return alone, contended, sum(counts), len(errors) + write_errors
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--commits", type=int, default=1000)
+    parser.add_argument("--readers", type=int, default=2)
+    parser.add_argument("--dir", default=None, help="where to create the databases")
+    args = parser.parse_args()
+
+    print(
+        f"{'profile':>8} {'commits/s':>10} {'w/ readers':>11} {'reads':>8} {'errors':>7}"
+    )
+    for profile in SQLITE_PROFILES:
+        alone, contended, reads, errors = run(
+            profile, args.commits, args.readers, args.dir
+        )
+        print(f"{profile:>8} {alone:>10.0f} {contended:>11.0f} {reads:>8} {errors:>7}")
+
+
+if __name__ == "__main__":
+    main()
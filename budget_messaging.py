@@ -8,21 +8,20 @@ from lunchable.models import BudgetObject
 
 from typing import List, Optional
 
-from persistence import get_db
+from persistence import get_async_db
 from utils import Keyboard, make_tag
 
 logger = logging.getLogger("messaging")
 
 
+def get_previous_month(budget_date: datetime) -> datetime:
+    if budget_date.month == 1:
+        return budget_date.replace(month=12, year=budget_date.year - 1)
+    return budget_date.replace(month=budget_date.month - 1)
+
+
 def get_bugdet_buttons(current_budget_date: datetime) -> InlineKeyboardMarkup:
-    if current_budget_date.month == 1:
-        previous_month = current_budget_date.replace(
-            month=12, year=current_budget_date.year - 1
-        )
-    else:
-        previous_month = current_budget_date.replace(
-            month=current_budget_date.month - 1
-        )
+    previous_month = get_previous_month(current_budget_date)
 
     first_day_current_month = datetime.now().replace(
         day=1, hour=0, minute=0, second=0, microsecond=0
@@ -155,7 +154,7 @@ async def send_budget(
     first_day_of_budget: datetime,
     message_id: Optional[int],
 ) -> None:
-    settings = get_db().get_current_settings(update.effective_chat.id)
+    settings = await get_async_db().get_current_settings(update.effective_chat.id)
     tagging = settings.tagging if settings else True
 
     msg = build_budget_message(budget, first_day_of_budget, tagging=tagging)
@@ -200,7 +199,7 @@ async def show_budget_categories(
 async def hide_budget_categories(
     update: Update, budget: List[BudgetObject], budget_date: datetime
 ) -> None:
-    settings = get_db().get_current_settings(update.effective_chat.id)
+    settings = await get_async_db().get_current_settings(update.effective_chat.id)
     tagging = settings.tagging if settings else True
 
     msg = build_budget_message(budget, budget_date, tagging=tagging)
@@ -0,0 +1,263 @@
+import asyncio
+import hashlib
+import hmac
+import json
+import logging
+import os
+import secrets
+import threading
+import time
+from collections import defaultdict, deque
+from typing import Any, Awaitable, Callable, Deque, Dict, Optional, Tuple
+from urllib.parse import urlsplit
+
+import httpx
+
+from errors import CassetteMiss
+
+logger = logging.getLogger("cassettes")
+
+# Record/replay of the HTTP traffic to Lunch Money and DeepInfra, configured with:
+#
+#   CASSETTE_MODE=record|replay
+#   CASSETTE_PATH=path/to/cassette.jsonl
+#   CASSETTE_SPEED=1   (replay only: 1 is recorded timing, 10 is 10x faster, 0 no delay)
+#
+# Recordings never include tokens, and personal values (payees, notes, names,
+# prompts...) are replaced by keyed hashes, so the same value always maps to
+# the same pseudonym within a recording.
+
+RECORD = "record"
+REPLAY = "replay"
+
+SENSITIVE_KEYS = {
+    "lunch": {
+        "payee",
+        "original_name",
+        "display_name",
+        "notes",
+        "display_notes",
+        "name",
+        "description",
+        "category_name",
+        "category_group_name",
+        "institution_name",
+        "asset_name",
+        "asset_display_name",
+        "asset_institution_name",
+        "account_display_name",
+        "plaid_account_name",
+        "plaid_account_display_name",
+        "plaid_metadata",
+        "mask",
+        "user_name",
+        "user_email",
+        "budget_name",
+        "api_key_label",
+    },
+    "deepinfra": {"messages"},
+}
+
+# response headers the bot looks at
+RECORDED_HEADERS = ("content-type", "retry-after")
+
+
+class Cassette:
+    def __init__(self, path: str, mode: str, speed: float = 1.0):
+        self.path = path
+        self.mode = mode
+        self.speed = speed
+        self._lock = threading.Lock()
+        # (service, method, path) -> interactions, in the order they were recorded
+        self._interactions: Dict[Tuple[str, str, str], Deque[Dict[str, Any]]] = (
+            defaultdict(deque)
+        )
+        self._salt = secrets.token_bytes(16)
+
+        if mode == REPLAY:
+            with open(path) as f:
+                for line in f:
+                    if line.strip():
+                        interaction = json.loads(line)
+                        self._interactions[self._key_of(interaction)].append(
+                            interaction
+                        )
+            logger.info(f"Replaying {self.size()} interactions from {path}")
+        else:
+            logger.info(f"Recording interactions to {path}")
+
+    def size(self) -> int:
+        return sum(len(queue) for queue in self._interactions.values())
+
+    @staticmethod
+    def _key_of(interaction: Dict[str, Any]) -> Tuple[str, str, str]:
+        return interaction["service"], interaction["method"], interaction["path"]
+
+    def _pseudonym(self, key: str, value: Any) -> str:
+        digest = hmac.new(self._salt, json.dumps(value).encode(), hashlib.sha256)
+        return f"{key}-{digest.hexdigest()[:10]}"
+
+    def _pseudonymize_strings(self, key: str, value: Any) -> Any:
+        # keeps the shape of the value, since clients validate it
+        if isinstance(value, str):
+            return self._pseudonym(key, value)
+        if isinstance(value, dict):
+            return {k: self._pseudonymize_strings(k, v) for k, v in value.items()}
+        if isinstance(value, list):
+            return [self._pseudonymize_strings(key, v) for v in value]
+        return value
+
+    def anonymize(self, service: str, value: Any) -> Any:
+        sensitive = SENSITIVE_KEYS.get(service, set())
+        if isinstance(value, dict):
+            return {
+                k: (
+                    self._pseudonymize_strings(k, v)
+                    if k in sensitive
+                    else self.anonymize(service, v)
+                )
+                for k, v in value.items()
+            }
+        if isinstance(value, list):
+            return [self.anonymize(service, v) for v in value]
+        return value
+
+    def record(
+        self,
+        service: str,
+        method: str,
+        url: str,
+        params: Any,
+        body: Any,
+        response: httpx.Response,
+        elapsed: float,
+    ) -> None:
+        try:
+            content = {"json": self.anonymize(service, response.json())}
+        except ValueError:
+            content = {"text": response.text}
+        interaction = {
+            "service": service,
+            "method": method,
+            "path": urlsplit(str(url)).path,
+            "params": params,
+            "body": self.anonymize(service, _decode_body(body)),
+            "status": response.status_code,
+            "headers": {
+                h: response.headers[h]
+                for h in RECORDED_HEADERS
+                if h in response.headers
+            },
+            "elapsed": round(elapsed, 4),
+            **content,
+        }
+        with self._lock:
+            with open(self.path, "a") as f:
+                f.write(json.dumps(interaction, default=str) + "\n")
+
+    def next_response(
+        self, service: str, method: str, url: str
+    ) -> Tuple[httpx.Response, float]:
+        """Pops the next recorded interaction for the endpoint. Returns its
+        response and how long to wait before serving it."""
+        key = (service, method, urlsplit(str(url)).path)
+        with self._lock:
+            queue = self._interactions.get(key)
+            if not queue:
+                raise CassetteMiss(f"No recorded interaction left for {key}")
+            interaction = queue.popleft()
+
+        if "json" in interaction:
+            content = json.dumps(interaction["json"]).encode()
+        else:
+            content = interaction.get("text", "").encode()
+        response = httpx.Response(
+            interaction["status"],
+            headers=interaction["headers"],
+            content=content,
+            request=httpx.Request(method, url),
+        )
+        delay = interaction["elapsed"] / self.speed if self.speed > 0 else 0.0
+        return response, delay
+
+
+def _decode_body(body: Any) -> Any:
+    if isinstance(body, (bytes, str)):
+        try:
+            return json.loads(body)
+        except ValueError:
+            return None
+    return body
+
+
+cassette: Optional[Cassette] = None
+cassette_lock = threading.Lock()
+
+
+def get_cassette() -> Optional[Cassette]:
+    global cassette
+    mode = os.getenv("CASSETTE_MODE", "").lower()
+    if mode not in (RECORD, REPLAY):
+        return None
+
+    if cassette is None:
+        with cassette_lock:
+            if cassette is None:
+                cassette = Cassette(
+                    os.getenv("CASSETTE_PATH", "cassette.jsonl"),
+                    mode,
+                    float(os.getenv("CASSETTE_SPEED", "1")),
+                )
+    return cassette
+
+
+def through_cassette(
+    service: str,
+    method: str,
+    url: Any,
+    send: Callable[[], httpx.Response],
+    params: Any = None,
+    body: Any = None,
+) -> httpx.Response:
+    """Sends the request, recording it or replaying it instead if a cassette is on."""
+    active = get_cassette()
+    if active is None:
+        return send()
+
+    if active.mode == REPLAY:
+        response, delay = active.next_response(service, method, str(url))
+        time.sleep(delay)
+        return response
+
+    started_at = time.monotonic()
+    response = send()
+    active.record(
+        service, method, url, params, body, response, time.monotonic() - started_at
+    )
+    return response
+
+
+async def through_cassette_async(
+    service: str,
+    method: str,
+    url: Any,
+    send: Callable[[], Awaitable[httpx.Response]],
+    params: Any = None,
+    body: Any = None,
+) -> httpx.Response:
+    """Same as through_cassette, for asyncio clients."""
+    active = get_cassette()
+    if active is None:
+        return await send()
+
+    if active.mode == REPLAY:
+        response, delay = active.next_response(service, method, str(url))
+        await asyncio.sleep(delay)
+        return response
+
+    started_at = time.monotonic()
+    response = await send()
+    active.record(
+        service, method, url, params, body, response, time.monotonic() - started_at
+    )
+    return response
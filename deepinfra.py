@@ -2,7 +2,7 @@ import logging
 import os
 from typing import Optional
 from lunchable import LunchMoney, TransactionUpdateObject
-import requests
+import httpx
 
 from textwrap import dedent
 from lunchable.models import (
@@ -10,12 +10,16 @@ from lunchable.models import (
     CategoriesObject,
 )
 
-from lunch import get_lunch_client_for_chat_id
+from cassettes import through_cassette
+from lunch import get_lunch_client_for_chat_id, get_transaction, update_transaction
 from persistence import get_db
 from utils import remove_emojis
 
 logger = logging.getLogger(__name__)
 
+# large models can take a while to answer
+LLM_TIMEOUT_SECS = 120
+
 
 def get_transaction_input_variable(
     transaction: TransactionObject, override_notes: Optional[str] = None
@@ -100,7 +104,13 @@ def send_message_to_llm(content):
         "messages": [{"role": "user", "content": content}],
     }
 
-    response = requests.post(url, headers=headers, json=data)
+    response = through_cassette(
+        "deepinfra",
+        "POST",
+        url,
+        lambda: httpx.post(url, headers=headers, json=data, timeout=LLM_TIMEOUT_SECS),
+        body=data,
+    )
     get_db().inc_metric("deepinfra_requests")
 
     if response.status_code == 200:
@@ -124,7 +134,12 @@ def auto_categorize(tx_id: int, chat_id: int) -> str:
     categories = lunch.get_categories()
 
     try:
-        tx, category_id = get_suggested_category_id(tx_id, lunch)
+        tx, category_id = get_suggested_category_id(
+            tx_id,
+            lunch,
+            transaction=get_transaction(chat_id, tx_id),
+            categories=categories,
+        )
         if int(category_id) == tx.category_id:
             # no need to recategorize
             return "Already categorized correctly"
@@ -134,13 +149,14 @@ def auto_categorize(tx_id: int, chat_id: int) -> str:
             if cat.id == int(category_id):
                 settings = get_db().get_current_settings(chat_id)
                 if settings.mark_reviewed_after_categorized:
-                    lunch.update_transaction(
+                    update_transaction(
+                        chat_id,
                         tx_id,
                         TransactionUpdateObject(category_id=cat.id, status="cleared"),
                     )
                 else:
-                    lunch.update_transaction(
-                        tx_id, TransactionUpdateObject(category_id=cat.id)
+                    update_transaction(
+                        chat_id, tx_id, TransactionUpdateObject(category_id=cat.id)
                     )
                 return f"Transaction recategorized to {cat.name}"
 
@@ -151,10 +167,17 @@ def auto_categorize(tx_id: int, chat_id: int) -> str:
 
 
 def get_suggested_category_id(
-    tx_id: int, lunch: LunchMoney, override_notes: Optional[str] = None
+    tx_id: int,
+    lunch: LunchMoney,
+    override_notes: Optional[str] = None,
+    transaction: Optional[TransactionObject] = None,
+    categories: Optional[list[CategoriesObject]] = None,
 ) -> tuple[TransactionObject, int]:
-    tx = lunch.get_transaction(tx_id)
-    categories = lunch.get_categories()
+    # callers that already hold the transaction or the categories can pass
+    # them along to save the round trips
+    tx = transaction or lunch.get_transaction(tx_id)
+    if categories is None:
+        categories = lunch.get_categories()
 
     prompt = build_prompt(tx, categories, override_notes=override_notes)
     logger.info(prompt)
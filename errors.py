@@ -2,3 +2,9 @@ class NoLunchToken(Exception):
     def __init__(self, message):
         super().__init__(message)
         self.message = message
+
+
+class CassetteMiss(LookupError):
+    def __init__(self, message):
+        super().__init__(message)
+        self.message = message
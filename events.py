@@ -0,0 +1,71 @@
+import logging
+import threading
+from dataclasses import dataclass
+from typing import Any, Callable, Dict, List, Optional, Type
+
+logger = logging.getLogger("events")
+
+# In-process pub/sub used to keep the caches (clients, transactions, budgets,
+# categories...) in sync with the changes the bot makes. Publishers say what
+# changed, and each cache subscribes and evicts what it holds for it.
+
+
+@dataclass(frozen=True)
+class TokenChanged:
+    """The chat registered a new token, or removed it by logging out."""
+
+    chat_id: int
+
+
+@dataclass(frozen=True)
+class TransactionUpdated:
+    chat_id: int
+    tx_id: int
+    # the fields sent to Lunch Money, with their new values
+    changes: Dict[str, Any]
+    # whether Lunch Money acknowledged the update
+    confirmed: bool = True
+
+
+@dataclass(frozen=True)
+class CategoriesChanged:
+    chat_id: int
+
+
+class EventBus:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._subscribers: Dict[Type, List[Callable[[Any], None]]] = {}
+
+    def subscribe(self, event_type: Type, callback: Callable[[Any], None]) -> None:
+        with self._lock:
+            self._subscribers.setdefault(event_type, []).append(callback)
+
+    def publish(self, event: Any) -> None:
+        """Calls the subscribers of the event type synchronously, in the
+        order they subscribed. A failing subscriber is logged and does not
+        keep the others from running."""
+        with self._lock:
+            subscribers = list(self._subscribers.get(type(event), []))
+        for callback in subscribers:
+            try:
+                callback(event)
+            except Exception as e:
+                logger.error(f"Subscriber {callback.__name__} failed on {event}: {e}")
+
+
+event_bus = EventBus()
+
+
+def subscribe(event_type: Type, bus: Optional[EventBus] = None):
+    """Decorator that subscribes the function to the event type."""
+
+    def decorator(callback: Callable[[Any], None]):
+        (bus or event_bus).subscribe(event_type, callback)
+        return callback
+
+    return decorator
+
+
+def publish(event: Any) -> None:
+    event_bus.publish(event)
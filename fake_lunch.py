@@ -0,0 +1,617 @@
+import argparse
+import asyncio
+import logging
+import random
+from datetime import date, datetime, timedelta, timezone
+from typing import Any, Dict, List, Optional
+
+from aiohttp import web
+
+logger = logging.getLogger("fake_lunch")
+
+# A local stand-in for the Lunch Money API, for running and load testing the
+# bot without a Lunch Money account:
+#
+#   python fake_lunch.py --transactions 5000 --latency-ms 80 --error-rate 0.01
+#   LUNCH_MONEY_API_URL=http://localhost:8090 python main.py
+#
+# Any token is accepted, and every token gets its own synthetic account,
+# generated from the seed and the token so runs are reproducible.
+
+PAYEES = [
+    "Amazon",
+    "Whole Foods",
+    "Trader Joe's",
+    "Starbucks",
+    "Blue Bottle",
+    "Uber",
+    "Lyft",
+    "Shell",
+    "Chevron",
+    "Netflix",
+    "Spotify",
+    "Costco",
+    "Target",
+    "Delta",
+    "Chipotle",
+    "Apple",
+    "PG&E",
+    "Comcast",
+]
+
+CATEGORY_GROUPS = {
+    "Food": ["Groceries", "Restaurants", "Coffee"],
+    "Transportation": ["Gas", "Rideshare", "Flights"],
+    "Shopping": ["Online", "Electronics", "Household"],
+    "Bills": ["Subscriptions", "Utilities", "Internet"],
+}
+STANDALONE_CATEGORIES = ["Income", "Transfers", "Health"]
+
+PLAID_ACCOUNTS = [
+    ("Checking", "depository", "checking"),
+    ("Savings", "depository", "savings"),
+    ("Sapphire", "credit", "credit card"),
+    ("Freedom", "credit", "credit card"),
+]
+
+
+def _timestamp(d: date) -> str:
+    return datetime(d.year, d.month, d.day, 12, tzinfo=timezone.utc).isoformat()
+
+
+def _month_start(d: date) -> date:
+    return d.replace(day=1)
+
+
+class FakeAccount:
+    """A synthetic Lunch Money account, kept in the JSON shapes the API returns."""
+
+    def __init__(self, seed: str, transactions: int, days: int):
+        rng = random.Random(seed)
+        today = date.today()
+        self.categories: List[Dict[str, Any]] = []
+        self.assets: List[Dict[str, Any]] = []
+        self.plaid_accounts: List[Dict[str, Any]] = []
+        self.crypto: List[Dict[str, Any]] = []
+        self.tags: List[Dict[str, Any]] = [
+            {"id": i + 1, "name": name, "description": None}
+            for i, name in enumerate(["reimbursable", "travel", "gift", "work"])
+        ]
+        self.transactions: Dict[int, Dict[str, Any]] = {}
+
+        next_id = 1
+        for group_name, children in CATEGORY_GROUPS.items():
+            group = self._category(next_id, group_name, is_group=True)
+            group["children"] = []
+            self.categories.append(group)
+            next_id += 1
+            for child_name in children:
+                child = self._category(next_id, child_name, group=group)
+                group["children"].append(dict(child))
+                self.categories.append(child)
+                next_id += 1
+        for name in STANDALONE_CATEGORIES:
+            self.categories.append(
+                self._category(next_id, name, is_income=name == "Income")
+            )
+            next_id += 1
+
+        for i, (name, type_, subtype) in enumerate(PLAID_ACCOUNTS):
+            self.plaid_accounts.append(
+                {
+                    "id": 100 + i,
+                    "date_linked": (today - timedelta(days=400)).isoformat(),
+                    "name": name,
+                    "display_name": f"{name} ({1000 + i})",
+                    "type": type_,
+                    "subtype": subtype,
+                    "mask": str(1000 + i),
+                    "institution_name": "Fake Bank",
+                    "status": "active",
+                    "limit": 10000 if type_ == "credit" else None,
+                    "balance": round(rng.uniform(100, 20000), 2),
+                    "currency": "usd",
+                    "balance_last_update": _timestamp(today),
+                }
+            )
+
+        for i, (name, type_name) in enumerate(
+            [("Wallet", "cash"), ("Store card", "credit"), ("House", "real estate")]
+        ):
+            self.assets.append(
+                {
+                    "id": 200 + i,
+                    "type_name": type_name,
+                    "subtype_name": None,
+                    "name": name,
+                    "display_name": name,
+                    "balance": round(rng.uniform(10, 500000), 2),
+                    "balance_as_of": _timestamp(today),
+                    "currency": "usd",
+                    "institution_name": None,
+                    "exclude_transactions": False,
+                    "created_at": _timestamp(today - timedelta(days=400)),
+                }
+            )
+
+        for i, (name, currency) in enumerate([("Bitcoin", "btc"), ("Ether", "eth")]):
+            self.crypto.append(
+                {
+                    "id": 300 + i,
+                    "zabo_account_id": None,
+                    "source": "manual",
+                    "name": name,
+                    "display_name": name,
+                    "balance": round(rng.uniform(0.01, 3), 4),
+                    "balance_as_of": _timestamp(today),
+                    "currency": currency,
+                    "status": "active",
+                    "institution_name": "Fake Exchange",
+                    "created_at": _timestamp(today - timedelta(days=400)),
+                }
+            )
+
+        leaf_categories = [c for c in self.categories if not c["is_group"]]
+        for tx_id in range(1000, 1000 + transactions):
+            tx_date = today - timedelta(days=rng.randrange(days))
+            account = rng.choice(self.plaid_accounts)
+            category = rng.choice(leaf_categories + [None])
+            age = (today - tx_date).days
+            self.transactions[tx_id] = self._transaction(
+                tx_id,
+                tx_date,
+                payee=rng.choice(PAYEES),
+                amount=round(rng.lognormvariate(3, 1), 2),
+                account=account,
+                category=category,
+                status="uncleared" if age < 14 and rng.random() < 0.5 else "cleared",
+                is_pending=age < 3 and rng.random() < 0.3,
+            )
+
+    def _category(
+        self,
+        category_id: int,
+        name: str,
+        is_group: bool = False,
+        is_income: bool = False,
+        group: Optional[Dict[str, Any]] = None,
+    ) -> Dict[str, Any]:
+        return {
+            "id": category_id,
+            "name": name,
+            "description": None,
+            "is_income": is_income,
+            "exclude_from_budget": False,
+            "exclude_from_totals": False,
+            "is_group": is_group,
+            "group_id": group["id"] if group else None,
+            "archived": False,
+            "order": category_id,
+        }
+
+    def _transaction(
+        self,
+        tx_id: int,
+        tx_date: date,
+        payee: str,
+        amount: float,
+        account: Optional[Dict[str, Any]],
+        category: Optional[Dict[str, Any]],
+        status: str,
+        is_pending: bool = False,
+        notes: Optional[str] = None,
+        asset_id: Optional[int] = None,
+    ) -> Dict[str, Any]:
+        tx = {
+            "id": tx_id,
+            "date": tx_date.isoformat(),
+            "payee": payee,
+            "original_name": payee,
+            "display_name": payee,
+            "amount": f"{amount:.4f}",
+            "currency": "usd",
+            "to_base": amount,
+            "notes": notes,
+            "status": status,
+            "is_pending": is_pending,
+            "is_income": False,
+            "exclude_from_budget": False,
+            "exclude_from_totals": False,
+            "recurring_type": None,
+            "parent_id": None,
+            "has_children": False,
+            "is_group": False,
+            "group_id": None,
+            "asset_id": asset_id,
+            "asset_name": None,
+            "asset_institution_name": None,
+            "plaid_account_id": account["id"] if account else None,
+            "plaid_account_name": account["name"] if account else None,
+            "plaid_account_display_name": account["display_name"] if account else None,
+            "account_display_name": account["display_name"] if account else None,
+            "plaid_metadata": (
+                {"transaction_id": f"plaid-{tx_id}", "name": payee.upper()}
+                if account
+                else None
+            ),
+            "source": "plaid" if account else "api",
+            "tags": [],
+            "created_at": _timestamp(tx_date),
+            "updated_at": _timestamp(tx_date),
+        }
+        self._set_category(tx, category)
+        return tx
+
+    def _set_category(
+        self, tx: Dict[str, Any], category: Optional[Dict[str, Any]]
+    ) -> None:
+        group = self.category(category["group_id"]) if category else None
+        tx["category_id"] = category["id"] if category else None
+        tx["category_name"] = category["name"] if category else None
+        tx["category_group_id"] = group["id"] if group else None
+        tx["category_group_name"] = group["name"] if group else None
+
+    def category(self, category_id: Optional[int]) -> Optional[Dict[str, Any]]:
+        for category in self.categories:
+            if category["id"] == category_id:
+                return category
+        return None
+
+    def update_transaction(self, tx: Dict[str, Any], changes: Dict[str, Any]) -> None:
+        for field in ("payee", "notes", "status", "date"):
+            if field in changes:
+                tx[field] = changes[field]
+        if "amount" in changes:
+            tx["amount"] = f"{float(changes['amount']):.4f}"
+            tx["to_base"] = float(changes["amount"])
+        if "category_id" in changes:
+            category_id = changes["category_id"]
+            self._set_category(
+                tx, self.category(int(category_id)) if category_id else None
+            )
+        if "tags" in changes:
+            tx["tags"] = [self._tag(tag) for tag in changes["tags"] or []]
+        tx["updated_at"] = datetime.now(timezone.utc).isoformat()
+
+    def _tag(self, tag: Any) -> Dict[str, Any]:
+        for existing in self.tags:
+            if existing["id"] == tag or existing["name"] == tag:
+                return {"id": existing["id"], "name": existing["name"]}
+        created = {"id": len(self.tags) + 1, "name": str(tag), "description": None}
+        self.tags.append(created)
+        return {"id": created["id"], "name": created["name"]}
+
+    def insert_transaction(self, data: Dict[str, Any]) -> int:
+        tx_id = max(self.transactions, default=999) + 1
+        tx = self._transaction(
+            tx_id,
+            date.fromisoformat(str(data["date"])[:10]),
+            payee=data.get("payee") or "",
+            amount=float(data["amount"]),
+            account=None,
+            category=self.category(data.get("category_id")),
+            status=data.get("status") or "uncleared",
+            notes=data.get("notes"),
+            asset_id=data.get("asset_id"),
+        )
+        tx["currency"] = data.get("currency") or "usd"
+        self.transactions[tx_id] = tx
+        return tx_id
+
+    def budgets(self, start_date: date, end_date: date) -> List[Dict[str, Any]]:
+        months = []
+        month = _month_start(start_date)
+        while month <= end_date:
+            months.append(month)
+            month = (month + timedelta(days=32)).replace(day=1)
+
+        spending: Dict[tuple, List[float]] = {}
+        for tx in self.transactions.values():
+            tx_date = date.fromisoformat(tx["date"])
+            if tx["category_id"] is None or not start_date <= tx_date <= end_date:
+                continue
+            totals = spending.setdefault(
+                (tx["category_id"], _month_start(tx_date)), [0.0, 0]
+            )
+            totals[0] += tx["to_base"]
+            totals[1] += 1
+
+        budgets = []
+        for category in self.categories:
+            group = self.category(category["group_id"])
+            data = {}
+            for month in months:
+                if category["is_group"]:
+                    child_ids = [child["id"] for child in category["children"]]
+                    amounts = [spending.get((i, month), [0.0, 0]) for i in child_ids]
+                    spent = sum(a[0] for a in amounts)
+                    count = sum(a[1] for a in amounts)
+                else:
+                    spent, count = spending.get((category["id"], month), [0.0, 0])
+                budget = 500.0 if not category["is_income"] else 0.0
+                data[month.isoformat()] = {
+                    "budget_amount": budget,
+                    "budget_currency": "usd",
+                    "budget_to_base": budget,
+                    "spending_to_base": round(spent, 2),
+                    "num_transactions": count,
+                }
+            budgets.append(
+                {
+                    "category_name": category["name"],
+                    "category_id": category["id"],
+                    "category_group_name": group["name"] if group else None,
+                    "group_id": category["group_id"],
+                    "is_group": category["is_group"],
+                    "is_income": category["is_income"],
+                    "exclude_from_budget": False,
+                    "exclude_from_totals": False,
+                    "data": data,
+                    "config": None,
+                    "order": category["order"],
+                }
+            )
+        return budgets
+
+
+def _account(request: web.Request) -> FakeAccount:
+    token = request.headers.get("Authorization", "").removeprefix("Bearer ").strip()
+    if not token:
+        raise web.HTTPUnauthorized(
+            text='{"error": "Access token does not exist."}',
+            content_type="application/json",
+        )
+    accounts: Dict[str, FakeAccount] = request.app["accounts"]
+    if token not in accounts:
+        config = request.app["config"]
+        accounts[token] = FakeAccount(
+            f"{config['seed']}:{token}", config["transactions"], config["days"]
+        )
+    return accounts[token]
+
+
+def _transaction_or_404(account: FakeAccount, request: web.Request):
+    tx = account.transactions.get(int(request.match_info["tx_id"]))
+    if tx is None:
+        raise web.HTTPNotFound(
+            text='{"error": "Transaction ID not found."}',
+            content_type="application/json",
+        )
+    return tx
+
+
+@web.middleware
+async def fault_injection(request: web.Request, handler):
+    config = request.app["config"]
+    rng: random.Random = request.app["rng"]
+    latency_ms = max(0.0, rng.gauss(config["latency_ms"], config["jitter_ms"]))
+    if latency_ms:
+        await asyncio.sleep(latency_ms / 1000)
+
+    roll = rng.random()
+    if roll < config["rate_limit_rate"]:
+        return web.json_response(
+            {"error": "Too many requests"},
+            status=429,
+            headers={"Retry-After": str(config["retry_after"])},
+        )
+    if roll < config["rate_limit_rate"] + config["error_rate"]:
+        return web.json_response({"error": "Injected failure"}, status=500)
+    return await handler(request)
+
+
+async def handle_get_user(request: web.Request):
+    _account(request)
+    return web.json_response(
+        {
+            "user_id": 1,
+            "user_name": "Fake User",
+            "user_email": "fake@example.com",
+            "account_id": 1,
+            "budget_name": "Fake Budget",
+            "api_key_label": "fake_lunch",
+        }
+    )
+
+
+async def handle_get_transactions(request: web.Request):
+    account = _account(request)
+    query = request.query
+    start_date = date.fromisoformat(query.get("start_date", "1970-01-01"))
+    end_date = date.fromisoformat(query.get("end_date", "9999-12-31"))
+    include_pending = query.get("pending", "false").lower() == "true"
+    offset = int(query.get("offset", 0))
+    limit = int(query.get("limit", 1000))
+
+    matching = []
+    for tx in account.transactions.values():
+        if not start_date <= date.fromisoformat(tx["date"]) <= end_date:
+            continue
+        if tx["is_pending"] and not include_pending:
+            continue
+        if "status" in query and tx["status"] != query["status"]:
+            continue
+        if any(
+            field in query and str(tx[field]) != query[field]
+            for field in ("category_id", "plaid_account_id", "asset_id")
+        ):
+            continue
+        matching.append(tx)
+
+    matching.sort(key=lambda tx: (tx["date"], tx["id"]))
+    page = matching[offset : offset + limit]
+    return web.json_response(
+        {"transactions": page, "has_more": offset + limit < len(matching)}
+    )
+
+
+async def handle_get_transaction(request: web.Request):
+    return web.json_response(_transaction_or_404(_account(request), request))
+
+
+async def handle_update_transaction(request: web.Request):
+    account = _account(request)
+    tx = _transaction_or_404(account, request)
+    body = await request.json()
+    account.update_transaction(tx, body.get("transaction") or {})
+    return web.json_response({"updated": True})
+
+
+async def handle_insert_transactions(request: web.Request):
+    account = _account(request)
+    body = await request.json()
+    ids = [account.insert_transaction(tx) for tx in body.get("transactions", [])]
+    return web.json_response({"ids": ids})
+
+
+async def handle_get_categories(request: web.Request):
+    return web.json_response({"categories": _account(request).categories})
+
+
+async def handle_get_category(request: web.Request):
+    category = _account(request).category(int(request.match_info["category_id"]))
+    if category is None:
+        raise web.HTTPNotFound(
+            text='{"error": "Category ID not found."}',
+            content_type="application/json",
+        )
+    return web.json_response({"children": [], **category})
+
+
+async def handle_get_budgets(request: web.Request):
+    account = _account(request)
+    start_date = date.fromisoformat(request.query["start_date"])
+    end_date = date.fromisoformat(request.query["end_date"])
+    return web.json_response(account.budgets(start_date, end_date))
+
+
+async def handle_get_assets(request: web.Request):
+    return web.json_response({"assets": _account(request).assets})
+
+
+async def handle_get_plaid_accounts(request: web.Request):
+    return web.json_response({"plaid_accounts": _account(request).plaid_accounts})
+
+
+async def handle_fetch_from_plaid(request: web.Request):
+    _account(request)
+    return web.json_response(True)
+
+
+async def handle_get_crypto(request: web.Request):
+    return web.json_response({"crypto": _account(request).crypto})
+
+
+async def handle_get_tags(request: web.Request):
+    return web.json_response(_account(request).tags)
+
+
+def create_app(
+    seed: int = 42,
+    transactions: int = 1000,
+    days: int = 120,
+    latency_ms: float = 0,
+    jitter_ms: float = 0,
+    error_rate: float = 0,
+    rate_limit_rate: float = 0,
+    retry_after: float = 1,
+) -> web.Application:
+    app = web.Application(middlewares=[fault_injection])
+    app["config"] = {
+        "seed": seed,
+        "transactions": transactions,
+        "days": days,
+        "latency_ms": latency_ms,
+        "jitter_ms": jitter_ms,
+        "error_rate": error_rate,
+        "rate_limit_rate": rate_limit_rate,
+        "retry_after": retry_after,
+    }
+    app["rng"] = random.Random(f"{seed}:faults")
+    app["accounts"] = {}
+
+    app.router.add_get("/v1/me", handle_get_user)
+    app.router.add_get("/v1/transactions", handle_get_transactions)
+    app.router.add_post("/v1/transactions", handle_insert_transactions)
+    app.router.add_get("/v1/transactions/{tx_id:\\d+}", handle_get_transaction)
+    app.router.add_put("/v1/transactions/{tx_id:\\d+}", handle_update_transaction)
+    app.router.add_get("/v1/categories", handle_get_categories)
+    app.router.add_get("/v1/categories/{category_id:\\d+}", handle_get_category)
+    app.router.add_get("/v1/budgets", handle_get_budgets)
+    app.router.add_get("/v1/assets", handle_get_assets)
+    app.router.add_get("/v1/plaid_accounts", handle_get_plaid_accounts)
+    app.router.add_post("/v1/plaid_accounts/fetch", handle_fetch_from_plaid)
+    app.router.add_get("/v1/crypto", handle_get_crypto)
+    app.router.add_get("/v1/tags", handle_get_tags)
+    return app
+
+
+async def run_fake_lunch(host: str = "localhost", port: int = 8090, **kwargs):
+    """Starts the fake server in the running event loop. Returns its runner."""
+    runner = web.AppRunner(create_app(**kwargs))
+    await runner.setup()
+    site = web.TCPSite(runner, host, port)
+    await site.start()
+    logger.info(f"Fake Lunch Money API listening on http://{host}:{port}")
+    return runner
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    parser = argparse.ArgumentParser(description="Run a fake Lunch Money API.")
+    parser.add_argument("--host", type=str, default="localhost")
+    parser.add_argument("--port", type=int, default=8090)
+    parser.add_argument(
+        "--seed", type=int, default=42, help="Seed for the synthetic data"
+    )
+    parser.add_argument(
+        "--transactions",
+        type=int,
+        default=1000,
+        help="Number of transactions per token (default: 1000)",
+    )
+    parser.add_argument(
+        "--days",
+        type=int,
+        default=120,
+        help="Days back the transactions are spread over (default: 120)",
+    )
+    parser.add_argument(
+        "--latency-ms", type=float, default=0, help="Mean latency added to requests"
+    )
+    parser.add_argument(
+        "--jitter-ms", type=float, default=0, help="Standard deviation of the latency"
+    )
+    parser.add_argument(
+        "--error-rate",
+        type=float,
+        default=0,
+        help="Fraction of requests that fail with a 500",
+    )
+    parser.add_argument(
+        "--rate-limit-rate",
+        type=float,
+        default=0,
+        help="Fraction of requests rejected with a 429",
+    )
+    parser.add_argument(
+        "--retry-after",
+        type=float,
+        default=1,
+        help="Retry-After seconds sent with the 429s",
+    )
+    args = parser.parse_args()
+    web.run_app(
+        create_app(
+            seed=args.seed,
+            transactions=args.transactions,
+            days=args.days,
+            latency_ms=args.latency_ms,
+            jitter_ms=args.jitter_ms,
+            error_rate=args.error_rate,
+            rate_limit_rate=args.rate_limit_rate,
+            retry_after=args.retry_after,
+        ),
+        host=args.host,
+        port=args.port,
+    )
@@ -48,7 +48,7 @@ async def handle_amazon_sync(update: Update, context: ContextTypes.DEFAULT_TYPE)
         reply_markup=Keyboard.build_from(("Nevermind", "cancel")),
     )
 
-    set_expectation(
+    await set_expectation(
         update.message.chat_id,
         {
             "expectation": AMAZON_EXPORT,
@@ -185,7 +185,7 @@ async def handle_amazon_export(update: Update, context: ContextTypes.DEFAULT_TYP
         await pre_processing_amazon_transactions(update, context)
 
         # clear expectation and delete that initial message
-        prev = clear_expectation(update.message.chat_id)
+        prev = await clear_expectation(update.message.chat_id)
         if prev and prev["msg_id"]:
             await context.bot.delete_message(
                 chat_id=update.effective_chat.id, message_id=int(prev["msg_id"])
@@ -242,12 +242,13 @@ async def handle_preview_process_amazon_transactions(
         await query.edit_message_text(
             "⏳ Processing transactions. This might take a while. Be patient."
         )
-        result = process_amazon_transactions(
+        result = await process_amazon_transactions(
             file_path=export_file,
             days_back=30,
             dry_run=True,
             allow_days=5,
             auto_categorize=ai_categorization_enabled,
+            chat_id=update.effective_chat.id,
         )
 
         processed_transactions = result["processed_transactions"]
@@ -344,12 +345,13 @@ async def handle_process_amazon_transactions(
         msg = await query.edit_message_text(
             "⏳ Processing transactions. This might take a while. Be patient."
         )
-        result = process_amazon_transactions(
+        result = await process_amazon_transactions(
             file_path=export_file,
             days_back=30,
             dry_run=False,
             allow_days=5,
             auto_categorize=ai_categorization_enabled,
+            chat_id=update.effective_chat.id,
         )
 
         processed_transactions = result["processed_transactions"]
@@ -1,32 +1,84 @@
 import logging
 import os
+import re
 from datetime import datetime, timedelta
+from typing import Optional
 from telegram import Update
 from telegram.ext import ContextTypes
 from telegram.constants import ParseMode
-from persistence import get_db
+from api_metrics import lunch_api_metrics
+from persistence import get_async_db
 from utils import Keyboard
 
 logger = logging.getLogger(__name__)
 
+# Telegram rejects messages longer than this
+MAX_MESSAGE_LENGTH = 4096
+
+# range accepted by /stats <days>d
+MAX_STATS_DAYS = 3650
+
+
+def format_metric_value(value: float) -> str:
+    if int(value) == value:
+        return str(int(value))
+    # truncate to the first 4 decimals
+    return f"{value:.4f}"
+
+
+async def handle_range_stats(update: Update, days: int, metric_name: Optional[str]):
+    """Totals of the last `days` days, read from the analytics rollups."""
+    end = datetime.now()
+    start = end - timedelta(days=days - 1)
+    totals = await get_async_db().get_metric_totals(start, end, metric_name)
+
+    message = (
+        f"Analytics for the last {days} days "
+        f"({start.strftime('%b %d')} - {end.strftime('%b %d')}):\n\n"
+    )
+    for key, value in sorted(totals.items()):
+        message += f"`{key}`: `{format_metric_value(value)}`\n"
+    if not totals:
+        message += "No analytics data available for this range."
+
+    await update.message.reply_text(
+        text=message,
+        parse_mode=ParseMode.MARKDOWN,
+        reply_markup=Keyboard.build_from(("Close", "cancel")),
+    )
+
 
 async def handle_stats(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """/stats [metric] shows the current week day by day, /stats <days>d [metric]
+    the totals of the last days (e.g. /stats 90d)."""
     logger.info("Received /stats command")
     admin_user_id = os.getenv("ADMIN_USER_ID")
     if not admin_user_id or update.effective_user.id != int(admin_user_id):
         await update.message.reply_text("You are not authorized to use this command.")
         return
 
-    db = get_db()
+    args = list(context.args or [])
+    if args and re.fullmatch(r"-?\d+d?", args[0]):
+        days = int(args.pop(0).rstrip("d"))
+        if not 1 <= days <= MAX_STATS_DAYS:
+            await update.message.reply_text(
+                f"Usage: /stats [<days>d] [metric], with 1 to {MAX_STATS_DAYS} days "
+                "(e.g. /stats 90d)"
+            )
+            return
+        await handle_range_stats(update, days, args[0] if args else None)
+        return
+
+    db = get_async_db()
     today = datetime.now()
     start_of_week = today - timedelta(days=today.weekday())
     end_of_week = start_of_week + timedelta(days=6)
 
-    metric_name = context.args[0] if context.args else None
+    metric_name = args[0] if args else None
     if metric_name:
-        metrics = db.get_specific_metrics(metric_name, start_of_week, end_of_week)
+        metrics = await db.get_specific_metrics(metric_name, start_of_week, end_of_week)
     else:
-        metrics = db.get_all_metrics(start_of_week, end_of_week)
+        metrics = await db.get_all_metrics(start_of_week, end_of_week)
 
     message = "Analytics for the current week:\n\n"
     has_data = False
@@ -43,23 +95,26 @@ async def handle_stats(update: Update, context: ContextTypes.DEFAULT_TYPE):
                     all_metrics[key] = {}
                 all_metrics[key][date.strftime("%a %b %d")] = value
 
-    for metric_name, values in all_metrics.items():
+    for key, values in all_metrics.items():
         total_sum = sum(float(value) for value in values.values())
         if int(total_sum) == total_sum:
             total_sum = int(total_sum)
-        message += f"`{metric_name}` (Total: {total_sum:.4f})\n"
+        message += f"`{key}` (Total: {total_sum:.4f})\n"
         for date, value in values.items():
-            if int(value) == value:
-                value = int(value)
-            else:
-                # truncate to the first 4 decimals
-                value = f"{value:.4f}"
-            message += f"  {date}: `{value}`\n"
+            message += f"  {date}: `{format_metric_value(value)}`\n"
         message += "\n"
 
     if not has_data:
         message += "No analytics data available for this week."
 
+    if not metric_name:
+        header = "\nLunch Money API since startup:\n```\n"
+        footer = "\n```"
+        budget = MAX_MESSAGE_LENGTH - len(message) - len(header) - len(footer)
+        if budget > 0:
+            summary = lunch_api_metrics.summary(max_chars=budget)
+            message += f"{header}{summary}{footer}"
+
     await update.message.reply_text(
         text=message,
         parse_mode=ParseMode.MARKDOWN,
@@ -73,17 +128,26 @@ async def handle_status(update: Update, context: ContextTypes.DEFAULT_TYPE):
         await update.message.reply_text("You are not authorized to use this command.")
         return
 
-    db = get_db()
-    user_count = db.get_user_count()
-    db_size = db.get_db_size()
-    sent_message_count = db.get_sent_message_count()
+    db = get_async_db()
+    user_count = await db.get_user_count()
+    db_size = await db.get_db_size()
+    free_bytes = await db.get_free_bytes()
+    sent_message_count = await db.get_sent_message_count()
+    compaction = db.compaction_stats
 
     message = (
         f"Bot Status:\n\n"
         f"Number of users: {user_count}\n"
-        f"Database size: {db_size / (1024 * 1024):.2f} MB\n"
+        f"Database size: {db_size / (1024 * 1024):.2f} MB "
+        f"({free_bytes / (1024 * 1024):.2f} MB free)\n"
         f"Messages sent: {sent_message_count}\n"
     )
+    if compaction["last_run_at"]:
+        message += (
+            f"Compaction: {compaction['pruned_rows']} rows pruned, "
+            f"{compaction['reclaimed_bytes'] / (1024 * 1024):.2f} MB reclaimed "
+            f"since start (last run {compaction['last_run_at']:%b %d %H:%M})\n"
+        )
 
     await update.message.reply_text(
         text=message,
@@ -1,11 +1,12 @@
+import asyncio
 from typing import List, Optional, Union
 from telegram import InlineKeyboardMarkup, Update
 from telegram.ext import ContextTypes
 from telegram.constants import ParseMode
 
-from lunch import get_lunch_client_for_chat_id
+from lunch import get_async_lunch_client_for_chat_id
 from lunchable.models import PlaidAccountObject, AssetsObject, CryptoObject
-from persistence import get_db
+from persistence import get_async_db
 from utils import (
     Keyboard,
     get_crypto_symbol,
@@ -159,19 +160,24 @@ async def handle_show_balances(
     message_id: Optional[int] = None,
 ):
     """Shows all the Plaid accounts and its balances to the user."""
-    lunch = get_lunch_client_for_chat_id(update.effective_chat.id)
+    lunch = await get_async_lunch_client_for_chat_id(update.effective_chat.id)
 
-    all_accounts = []
+    fetches = []
     if is_show_balances(mask):
-        all_accounts += lunch.get_plaid_accounts()
+        fetches.append(lunch.get_plaid_accounts())
 
     if is_show_assets(mask):
-        all_accounts += lunch.get_assets()
+        fetches.append(lunch.get_assets())
 
     if is_show_crypto(mask):
-        all_accounts += lunch.get_crypto()
+        fetches.append(lunch.get_crypto())
+
+    # the account types are independent, so fetch them concurrently
+    all_accounts = []
+    for accounts in await asyncio.gather(*fetches):
+        all_accounts += accounts
 
-    settings = get_db().get_current_settings(update.effective_chat.id)
+    settings = await get_async_db().get_current_settings(update.effective_chat.id)
     tagging = settings.tagging if settings else True
 
     msg = get_accounts_summary_text(
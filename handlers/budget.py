@@ -1,17 +1,18 @@
 from datetime import datetime, timedelta
 import logging
-from lunchable import LunchMoney
 from telegram import Update
 from telegram.ext import ContextTypes
 
 from budget_messaging import (
+    get_previous_month,
     hide_budget_categories,
     send_budget,
     show_budget_categories,
     show_bugdget_for_category,
 )
-from lunch import get_lunch_client_for_chat_id
-from persistence import get_db
+from lunch import get_async_lunch_client_for_chat_id, get_budgets_async
+from persistence import get_async_db
+from rate_limiter import BACKGROUND, priority_lane
 
 logger = logging.getLogger("budget_handler")
 
@@ -43,14 +44,14 @@ def get_budget_range_from(date: datetime) -> tuple[datetime, datetime]:
     return date, end_of_month
 
 
-def get_default_budget(lunch: LunchMoney):
-    """Get the budget for the current month."""
-    # get a datetime of the first day of the current month
-    first_day_current_month, final_day_current_month = get_default_budget_range()
-
-    return lunch.get_budgets(
-        start_date=first_day_current_month, end_date=final_day_current_month
-    )
+async def prefetch_budget(chat_id: int, budget_date: datetime) -> None:
+    """Warms the budget cache for the month, so that navigating to it is instant."""
+    budget_date, budget_end_date = get_budget_range_from(budget_date)
+    try:
+        with priority_lane(BACKGROUND):
+            await get_budgets_async(chat_id, budget_date, budget_end_date)
+    except Exception as e:
+        logger.warning(f"Could not prefetch budget for {budget_date}: {e}")
 
 
 async def handle_show_budget(update: Update, context: ContextTypes.DEFAULT_TYPE):
@@ -65,12 +66,18 @@ async def handle_show_budget(update: Update, context: ContextTypes.DEFAULT_TYPE)
     else:
         budget_date, budget_end_date = get_default_budget_range()
 
-    lunch = get_lunch_client_for_chat_id(update.effective_chat.id)
-    logger.info(f"Pulling budget for chat id {update.effective_chat.id}...")
+    chat_id = update.effective_chat.id
+    logger.info(f"Pulling budget for chat id {chat_id}...")
 
-    budget = lunch.get_budgets(start_date=budget_date, end_date=budget_end_date)
+    budget = await get_budgets_async(chat_id, budget_date, budget_end_date)
     await send_budget(update, context, budget, budget_date, message_id)
 
+    # the previous month is the most likely next button press
+    context.application.create_task(
+        prefetch_budget(chat_id, get_previous_month(budget_date)),
+        name=f"prefetch_budget_{chat_id}",
+    )
+
     # delete command message
     if update.message:
         await update.message.delete()
@@ -83,10 +90,10 @@ async def handle_btn_show_budget_categories(
     budget_date = update.callback_query.data.split("_")[1]
     budget_date = datetime.fromisoformat(budget_date)
 
-    lunch = get_lunch_client_for_chat_id(update.callback_query.message.chat.id)
+    chat_id = update.callback_query.message.chat.id
 
     budget_date, final_day_current_month = get_budget_range_from(budget_date)
-    budget = lunch.get_budgets(start_date=budget_date, end_date=final_day_current_month)
+    budget = await get_budgets_async(chat_id, budget_date, final_day_current_month)
 
     await update.callback_query.answer()
     await show_budget_categories(update, context, budget, budget_date)
@@ -99,10 +106,10 @@ async def handle_btn_hide_budget_categories(
     budget_date = update.callback_query.data.split("_")[1]
     budget_date = datetime.fromisoformat(budget_date)
 
-    lunch = get_lunch_client_for_chat_id(update.callback_query.message.chat.id)
+    chat_id = update.callback_query.message.chat.id
 
     budget_date, budget_end_date = get_budget_range_from(budget_date)
-    budget = lunch.get_budgets(start_date=budget_date, end_date=budget_end_date)
+    budget = await get_budgets_async(chat_id, budget_date, budget_end_date)
 
     await update.callback_query.answer()
     await hide_budget_categories(update, budget, budget_date)
@@ -117,13 +124,14 @@ async def handle_btn_show_budget_for_category(
     budget_date = datetime.fromisoformat(budget_date)
     category_id = int(parts[2])
 
-    lunch = get_lunch_client_for_chat_id(update.callback_query.message.chat.id)
+    chat_id = update.callback_query.message.chat.id
+    lunch = await get_async_lunch_client_for_chat_id(chat_id)
 
     budget_date, budget_end_date = get_budget_range_from(budget_date)
-    all_budget = lunch.get_budgets(start_date=budget_date, end_date=budget_end_date)
+    all_budget = await get_budgets_async(chat_id, budget_date, budget_end_date)
 
     # get super category
-    category = lunch.get_category(category_id)
+    category = await lunch.get_category(category_id)
     children_categories_ids = [child.id for child in category.children]
 
     sub_budget = []
@@ -131,7 +139,7 @@ async def handle_btn_show_budget_for_category(
         if budget_item.category_id in children_categories_ids:
             sub_budget.append(budget_item)
 
-    settings = get_db().get_current_settings(update.effective_chat.id)
+    settings = await get_async_db().get_current_settings(update.effective_chat.id)
     tagging = settings.tagging if settings else True
 
     await update.callback_query.answer()
@@ -1,5 +1,6 @@
 from typing import Dict, Optional
 
+from persistence import get_async_db
 
 EXPECTING_TOKEN = "token"
 EXPECTING_TIME_ZONE = "time_zone"
@@ -8,18 +9,18 @@ EDIT_NOTES = "edit_notes"
 SET_TAGS = "set_tags"
 AMAZON_EXPORT = "amazon_export"
 
-expectations: Dict[int, Optional[Dict[str, str]]] = {}
+# Expectations are stored in the database (see Persistence.set_expectation),
+# so they survive restarts and are shared by instances using the same one.
+# Unanswered ones expire after EXPECTATION_TTL_SECS.
 
 
-def get_expectation(chat_id: int) -> Optional[Dict[str, str]]:
-    return expectations.get(chat_id, None)
+async def get_expectation(chat_id: int) -> Optional[Dict[str, str]]:
+    return await get_async_db().get_expectation(chat_id)
 
 
-def set_expectation(chat_id: int, expectation: Dict[str, str]):
-    expectations[chat_id] = expectation
+async def set_expectation(chat_id: int, expectation: Dict[str, str]):
+    await get_async_db().set_expectation(chat_id, expectation)
 
 
-def clear_expectation(chat_id: int) -> Dict[str, str]:
-    prev = expectations[chat_id]
-    expectations[chat_id] = None
-    return prev
+async def clear_expectation(chat_id: int) -> Optional[Dict[str, str]]:
+    return await get_async_db().clear_expectation(chat_id)
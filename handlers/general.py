@@ -15,7 +15,6 @@ from handlers.settings.schedule_rendering import (
 from telegram.constants import ReactionEmoji
 
 from handlers.settings.session import handle_register_token
-from lunch import get_lunch_client_for_chat_id
 from handlers.expectations import (
     AMAZON_EXPORT,
     EDIT_NOTES,
@@ -27,11 +26,12 @@ from handlers.expectations import (
     get_expectation,
     set_expectation,
 )
-from persistence import get_db
-from tx_messaging import send_transaction_message
+from persistence import get_async_db, get_db
+from tx_messaging import apply_transaction_update
 import pytz
 
 from errors import NoLunchToken
+from events import CategoriesChanged, publish
 
 logger = logging.getLogger("handlers")
 
@@ -54,7 +54,7 @@ async def handle_start(update: Update, _: ContextTypes.DEFAULT_TYPE):
         disable_web_page_preview=True,
     )
 
-    set_expectation(
+    await set_expectation(
         update.effective_chat.id,
         {
             "expectation": EXPECTING_TOKEN,
@@ -100,7 +100,7 @@ async def handle_generic_message(
     update: Update, context: ContextTypes.DEFAULT_TYPE
 ) -> bool:
     # if waiting for a token, register it
-    expectation = get_expectation(update.effective_chat.id)
+    expectation = await get_expectation(update.effective_chat.id)
     if expectation and expectation["expectation"] == EXPECTING_TOKEN:
         await handle_register_token(
             update,
@@ -125,38 +125,33 @@ async def handle_generic_message(
             )
             return True
 
-        clear_expectation(update.effective_chat.id)
+        await clear_expectation(update.effective_chat.id)
 
         # save the time zone
-        get_db().update_timezone(update.effective_chat.id, update.message.text)
+        await get_async_db().update_timezone(
+            update.effective_chat.id, update.message.text
+        )
 
-        settings = get_db().get_current_settings(update.effective_chat.id)
+        settings = await get_async_db().get_current_settings(update.effective_chat.id)
         await context.bot.edit_message_text(
             message_id=expectation["msg_id"],
-            text=get_schedule_rendering_text(update.effective_chat.id),
+            text=await get_schedule_rendering_text(update.effective_chat.id),
             chat_id=update.effective_chat.id,
             reply_markup=get_schedule_rendering_buttons(settings),
             parse_mode=ParseMode.MARKDOWN_V2,
         )
         return True
     elif expectation and expectation["expectation"] == RENAME_PAYEE:
-        clear_expectation(update.effective_chat.id)
+        await clear_expectation(update.effective_chat.id)
 
-        # updates the transaction with the new payee
-        lunch = get_lunch_client_for_chat_id(update.effective_chat.id)
+        # updates the transaction with the new payee and edits its message
         transaction_id = int(expectation["transaction_id"])
-        lunch.update_transaction(
-            transaction_id, TransactionUpdateObject(payee=update.message.text)
-        )
-
-        # edit the message to reflect the new payee
-        updated_transaction = lunch.get_transaction(transaction_id)
-        msg_id = int(expectation["msg_id"])
-        await send_transaction_message(
-            context=context,
-            transaction=updated_transaction,
-            chat_id=update.effective_chat.id,
-            message_id=msg_id,
+        await apply_transaction_update(
+            context,
+            update.effective_chat.id,
+            transaction_id,
+            TransactionUpdateObject(payee=update.message.text),
+            int(expectation["msg_id"]),
         )
 
         # react to the message
@@ -167,27 +162,22 @@ async def handle_generic_message(
         )
         return True
     elif expectation and expectation["expectation"] == EDIT_NOTES:
-        clear_expectation(update.effective_chat.id)
+        await clear_expectation(update.effective_chat.id)
 
-        # updates the transaction with the new notes
-        lunch = get_lunch_client_for_chat_id(update.effective_chat.id)
+        # updates the transaction with the new notes and edits its message
         transaction_id = int(expectation["transaction_id"])
         notes = update.message.text
         if len(notes) > 350:
             notes = notes[:350]
-        lunch.update_transaction(transaction_id, TransactionUpdateObject(notes=notes))
-
-        # edit the message to reflect the new notes
-        updated_transaction = lunch.get_transaction(transaction_id)
-        msg_id = int(expectation["msg_id"])
-        await send_transaction_message(
-            context=context,
-            transaction=updated_transaction,
-            chat_id=update.effective_chat.id,
-            message_id=msg_id,
+        await apply_transaction_update(
+            context,
+            update.effective_chat.id,
+            transaction_id,
+            TransactionUpdateObject(notes=notes),
+            int(expectation["msg_id"]),
         )
 
-        settings = get_db().get_current_settings(update.effective_chat.id)
+        settings = await get_async_db().get_current_settings(update.effective_chat.id)
         if settings.auto_categorize_after_notes:
             await ai_categorize_transaction(
                 transaction_id, update.effective_chat.id, context
@@ -221,10 +211,9 @@ async def handle_generic_message(
             )
             return True
 
-        clear_expectation(update.effective_chat.id)
+        await clear_expectation(update.effective_chat.id)
 
         # updates the transaction with the new notes
-        lunch = get_lunch_client_for_chat_id(update.effective_chat.id)
         transaction_id = int(expectation["transaction_id"])
 
         tags_without_hashtag = [
@@ -233,18 +222,12 @@ async def handle_generic_message(
         logger.info(
             f"Setting tags to transaction ({transaction_id}): {tags_without_hashtag}"
         )
-        lunch.update_transaction(
-            transaction_id, TransactionUpdateObject(tags=tags_without_hashtag)
-        )
-
-        # edit the message to reflect the new notes
-        updated_transaction = lunch.get_transaction(transaction_id)
-        msg_id = int(expectation["msg_id"])
-        await send_transaction_message(
-            context=context,
-            transaction=updated_transaction,
-            chat_id=update.effective_chat.id,
-            message_id=msg_id,
+        await apply_transaction_update(
+            context,
+            update.effective_chat.id,
+            transaction_id,
+            TransactionUpdateObject(tags=tags_without_hashtag),
+            int(expectation["msg_id"]),
         )
 
         # react to the message
@@ -259,7 +242,9 @@ async def handle_generic_message(
 
 
 async def clear_cache(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
-    get_db().delete_transactions_for_chat(update.message.chat_id)
+    await get_async_db().delete_transactions_for_chat(update.message.chat_id)
+    # also forget the categories (and what embeds their names) fetched so far
+    publish(CategoriesChanged(update.message.chat_id))
     await context.bot.set_message_reaction(
         chat_id=update.message.chat_id,
         message_id=update.message.message_id,
@@ -279,7 +264,7 @@ async def handle_cancel(update: Update, context: ContextTypes.DEFAULT_TYPE):
 
 async def handle_file_upload(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Generic handler for file uploads"""
-    expectation = get_expectation(update.effective_chat.id)
+    expectation = await get_expectation(update.effective_chat.id)
     if expectation and expectation["expectation"] == AMAZON_EXPORT:
         await handle_amazon_export(update, context)
     else:
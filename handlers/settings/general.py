@@ -14,7 +14,7 @@ def get_general_settings_buttons() -> InlineKeyboardMarkup:
 
 
 async def handle_settings(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    ensure_token(update)
+    await ensure_token(update)
 
     await update.message.reply_text(
         text="🛠️ 🆂🅴🆃🆃🅸🅽🅶🆂\n\nPlease choose a settings category:",
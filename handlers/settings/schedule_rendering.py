@@ -6,12 +6,12 @@ from telegram.ext import ContextTypes
 from telegram.constants import ParseMode
 from handlers.expectations import EXPECTING_TIME_ZONE, set_expectation
 from utils import Keyboard
-from persistence import Settings, get_db
+from persistence import SettingsSnapshot, get_async_db
 from typing import Optional
 
 
-def get_schedule_rendering_text(chat_id: int) -> Optional[str]:
-    settings = get_db().get_current_settings(chat_id)
+async def get_schedule_rendering_text(chat_id: int) -> Optional[str]:
+    settings = await get_async_db().get_current_settings(chat_id)
     if settings is None:
         return None
 
@@ -79,7 +79,7 @@ def get_schedule_rendering_text(chat_id: int) -> Optional[str]:
     )
 
 
-def get_schedule_rendering_buttons(settings: Settings) -> InlineKeyboardMarkup:
+def get_schedule_rendering_buttons(settings: SettingsSnapshot) -> InlineKeyboardMarkup:
     kbd = Keyboard()
     kbd += ("➊ Change interval", "changePollInterval")
     kbd += ("➋ Toggle polling mode", f"togglePollPending_{settings.poll_pending}")
@@ -93,8 +93,8 @@ def get_schedule_rendering_buttons(settings: Settings) -> InlineKeyboardMarkup:
 async def handle_schedule_rendering_settings(
     update: Update, context: ContextTypes.DEFAULT_TYPE
 ):
-    settings_text = get_schedule_rendering_text(update.effective_chat.id)
-    settings = get_db().get_current_settings(update.effective_chat.id)
+    settings_text = await get_schedule_rendering_text(update.effective_chat.id)
+    settings = await get_async_db().get_current_settings(update.effective_chat.id)
     await update.callback_query.edit_message_text(
         text=settings_text,
         reply_markup=get_schedule_rendering_buttons(settings),
@@ -108,10 +108,12 @@ async def handle_btn_change_poll_interval(
     """Changes the poll interval for the chat."""
     if "_" in update.callback_query.data:
         poll_interval = int(update.callback_query.data.split("_")[1])
-        get_db().update_poll_interval(update.effective_chat.id, poll_interval)
-        settings = get_db().get_current_settings(update.effective_chat.id)
+        await get_async_db().update_poll_interval(
+            update.effective_chat.id, poll_interval
+        )
+        settings = await get_async_db().get_current_settings(update.effective_chat.id)
         await update.callback_query.edit_message_text(
-            text=f"_Poll interval updated_\n\n{get_schedule_rendering_text(update.effective_chat.id)}",
+            text=f"_Poll interval updated_\n\n{await get_schedule_rendering_text(update.effective_chat.id)}",
             reply_markup=get_schedule_rendering_buttons(settings),
             parse_mode=ParseMode.MARKDOWN_V2,
         )
@@ -133,8 +135,8 @@ async def handle_btn_change_poll_interval(
 async def handle_btn_cancel_poll_interval_change(
     update: Update, context: ContextTypes.DEFAULT_TYPE
 ):
-    settings_text = get_schedule_rendering_text(update.effective_chat.id)
-    settings = get_db().get_current_settings(update.effective_chat.id)
+    settings_text = await get_schedule_rendering_text(update.effective_chat.id)
+    settings = await get_async_db().get_current_settings(update.effective_chat.id)
     await update.callback_query.edit_message_text(
         text=settings_text,
         reply_markup=get_schedule_rendering_buttons(settings),
@@ -143,38 +145,42 @@ async def handle_btn_cancel_poll_interval_change(
 
 
 async def handle_btn_toggle_poll_pending(update: Update, _: ContextTypes.DEFAULT_TYPE):
-    settings = get_db().get_current_settings(update.effective_chat.id)
-    get_db().update_poll_pending(update.effective_chat.id, not settings.poll_pending)
+    settings = await get_async_db().get_current_settings(update.effective_chat.id)
+    await get_async_db().update_poll_pending(
+        update.effective_chat.id, not settings.poll_pending
+    )
 
     await update.callback_query.answer()
     await update.callback_query.edit_message_text(
-        text=get_schedule_rendering_text(update.effective_chat.id),
+        text=await get_schedule_rendering_text(update.effective_chat.id),
         reply_markup=get_schedule_rendering_buttons(settings),
         parse_mode=ParseMode.MARKDOWN_V2,
     )
 
 
 async def handle_btn_toggle_show_datetime(update: Update, _: ContextTypes.DEFAULT_TYPE):
-    settings = get_db().get_current_settings(update.effective_chat.id)
+    settings = await get_async_db().get_current_settings(update.effective_chat.id)
 
-    get_db().update_show_datetime(update.effective_chat.id, not settings.show_datetime)
+    await get_async_db().update_show_datetime(
+        update.effective_chat.id, not settings.show_datetime
+    )
 
     await update.callback_query.answer()
     await update.callback_query.edit_message_text(
-        text=get_schedule_rendering_text(update.effective_chat.id),
+        text=await get_schedule_rendering_text(update.effective_chat.id),
         reply_markup=get_schedule_rendering_buttons(settings),
         parse_mode=ParseMode.MARKDOWN_V2,
     )
 
 
 async def handle_btn_toggle_tagging(update: Update, _: ContextTypes.DEFAULT_TYPE):
-    settings = get_db().get_current_settings(update.effective_chat.id)
+    settings = await get_async_db().get_current_settings(update.effective_chat.id)
 
-    get_db().update_tagging(update.effective_chat.id, not settings.tagging)
+    await get_async_db().update_tagging(update.effective_chat.id, not settings.tagging)
 
     await update.callback_query.answer()
     await update.callback_query.edit_message_text(
-        text=get_schedule_rendering_text(update.effective_chat.id),
+        text=await get_schedule_rendering_text(update.effective_chat.id),
         reply_markup=get_schedule_rendering_buttons(settings),
         parse_mode=ParseMode.MARKDOWN_V2,
     )
@@ -204,7 +210,7 @@ async def handle_btn_change_timezone(
         parse_mode=ParseMode.MARKDOWN_V2,
         link_preview_options=LinkPreviewOptions(is_disabled=True),
     )
-    set_expectation(
+    await set_expectation(
         update.effective_chat.id,
         {
             "expectation": EXPECTING_TIME_ZONE,
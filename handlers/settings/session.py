@@ -1,3 +1,4 @@
+import asyncio
 import re
 from textwrap import dedent
 from typing import Optional
@@ -6,12 +7,12 @@ from telegram.ext import ContextTypes
 from telegram.constants import ParseMode, ReactionEmoji
 from handlers.expectations import EXPECTING_TOKEN, clear_expectation, set_expectation
 from utils import Keyboard
-from persistence import Settings, get_db
+from persistence import SettingsSnapshot, get_async_db
 from lunch import get_lunch_client, get_lunch_client_for_chat_id
 
 
-def get_session_text(chat_id: int) -> Optional[str]:
-    settings = get_db().get_current_settings(chat_id)
+async def get_session_text(chat_id: int) -> Optional[str]:
+    settings = await get_async_db().get_current_settings(chat_id)
     if settings is None:
         return None
 
@@ -24,7 +25,7 @@ def get_session_text(chat_id: int) -> Optional[str]:
     )
 
 
-def get_session_buttons(settings: Settings) -> InlineKeyboardMarkup:
+def get_session_buttons(settings: SettingsSnapshot) -> InlineKeyboardMarkup:
     kbd = Keyboard()
     kbd += ("🚪 Log out", "logout")
     kbd += ("🔄 Trigger Plaid Refresh", "triggerPlaidRefresh")
@@ -33,9 +34,9 @@ def get_session_buttons(settings: Settings) -> InlineKeyboardMarkup:
 
 
 async def handle_session_settings(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    settings = get_db().get_current_settings(update.effective_chat.id)
+    settings = await get_async_db().get_current_settings(update.effective_chat.id)
     await update.callback_query.edit_message_text(
-        text=get_session_text(update.effective_chat.id),
+        text=await get_session_text(update.effective_chat.id),
         reply_markup=get_session_buttons(settings),
         parse_mode=ParseMode.MARKDOWN_V2,
     )
@@ -47,7 +48,7 @@ async def handle_btn_set_token_from_button(
     msg = await update.callback_query.edit_message_text(
         text="Please provide a token to register",
     )
-    set_expectation(
+    await set_expectation(
         update.effective_chat.id,
         {
             "expectation": EXPECTING_TOKEN,
@@ -76,8 +77,8 @@ async def handle_logout(update: Update, _: ContextTypes.DEFAULT_TYPE):
 
 
 async def handle_logout_confirm(update: Update, _: ContextTypes.DEFAULT_TYPE):
-    get_db().logout(update.effective_chat.id)
-    get_db().delete_transactions_for_chat(update.effective_chat.id)
+    await get_async_db().logout(update.effective_chat.id)
+    await get_async_db().delete_transactions_for_chat(update.effective_chat.id)
 
     await update.callback_query.delete_message()
     await update.callback_query.answer(
@@ -93,16 +94,19 @@ async def handle_logout_cancel(update: Update, _: ContextTypes.DEFAULT_TYPE):
 async def handle_btn_trigger_plaid_refresh(
     update: Update, context: ContextTypes.DEFAULT_TYPE
 ):
-    lunch = get_lunch_client_for_chat_id(update.message.chat_id)
-    lunch.trigger_fetch_from_plaid()
+    # the sync client may wait on the rate limiter, so keep it off the event loop
+    lunch = await asyncio.to_thread(
+        get_lunch_client_for_chat_id, update.message.chat_id
+    )
+    await asyncio.to_thread(lunch.trigger_fetch_from_plaid)
     await context.bot.set_message_reaction(
         chat_id=update.message.chat_id,
         message_id=update.message.message_id,
         reaction=ReactionEmoji.HANDSHAKE,
     )
 
-    settings_text = get_session_text(update.effective_chat.id)
-    settings = get_db().get_current_settings(update.effective_chat.id)
+    settings_text = await get_session_text(update.effective_chat.id)
+    settings = await get_async_db().get_current_settings(update.effective_chat.id)
     await update.callback_query.edit_message_text(
         text=f"_Plaid refresh triggered_\n\n{settings_text}",
         reply_markup=get_session_buttons(settings),
@@ -153,10 +157,10 @@ async def handle_register_token(
     try:
         # make sure the token is valid
         lunch = get_lunch_client(token)
-        lunch_user = lunch.get_user()
-        get_db().save_token(update.message.chat_id, token)
+        lunch_user = await asyncio.to_thread(lunch.get_user)
+        await get_async_db().save_token(update.message.chat_id, token)
 
-        clear_expectation(hello_msg_id)
+        await clear_expectation(update.message.chat_id)
 
         await context.bot.delete_message(
             chat_id=update.effective_chat.id, message_id=hello_msg_id
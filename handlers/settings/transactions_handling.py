@@ -4,11 +4,11 @@ from telegram import InlineKeyboardMarkup, Update
 from telegram.ext import ContextTypes
 from telegram.constants import ParseMode
 from utils import Keyboard
-from persistence import Settings, get_db
+from persistence import SettingsSnapshot, get_async_db
 
 
-def get_transactions_handling_text(chat_id: int) -> Optional[str]:
-    settings = get_db().get_current_settings(chat_id)
+async def get_transactions_handling_text(chat_id: int) -> Optional[str]:
+    settings = await get_async_db().get_current_settings(chat_id)
     if settings is None:
         return None
 
@@ -32,7 +32,9 @@ def get_transactions_handling_text(chat_id: int) -> Optional[str]:
     )
 
 
-def get_transactions_handling_buttons(settings: Settings) -> InlineKeyboardMarkup:
+def get_transactions_handling_buttons(
+    settings: SettingsSnapshot,
+) -> InlineKeyboardMarkup:
     kbd = Keyboard()
     kbd += (
         "➊ Auto-mark reviewed?",
@@ -53,8 +55,8 @@ def get_transactions_handling_buttons(settings: Settings) -> InlineKeyboardMarku
 async def handle_transactions_handling_settings(
     update: Update, context: ContextTypes.DEFAULT_TYPE
 ):
-    settings_text = get_transactions_handling_text(update.effective_chat.id)
-    settings = get_db().get_current_settings(update.effective_chat.id)
+    settings_text = await get_transactions_handling_text(update.effective_chat.id)
+    settings = await get_async_db().get_current_settings(update.effective_chat.id)
     await update.callback_query.edit_message_text(
         text=settings_text,
         reply_markup=get_transactions_handling_buttons(settings),
@@ -65,14 +67,14 @@ async def handle_transactions_handling_settings(
 async def handle_btn_toggle_auto_mark_reviewed(
     update: Update, _: ContextTypes.DEFAULT_TYPE
 ):
-    settings = get_db().get_current_settings(update.effective_chat.id)
-    get_db().update_auto_mark_reviewed(
+    settings = await get_async_db().get_current_settings(update.effective_chat.id)
+    await get_async_db().update_auto_mark_reviewed(
         update.effective_chat.id, not settings.auto_mark_reviewed
     )
 
     await update.callback_query.answer()
     await update.callback_query.edit_message_text(
-        text=get_transactions_handling_text(update.effective_chat.id),
+        text=await get_transactions_handling_text(update.effective_chat.id),
         reply_markup=get_transactions_handling_buttons(settings),
         parse_mode=ParseMode.MARKDOWN_V2,
     )
@@ -81,14 +83,14 @@ async def handle_btn_toggle_auto_mark_reviewed(
 async def handle_btn_toggle_mark_reviewed_after_categorized(
     update: Update, _: ContextTypes.DEFAULT_TYPE
 ):
-    settings = get_db().get_current_settings(update.effective_chat.id)
-    get_db().update_mark_reviewed_after_categorized(
+    settings = await get_async_db().get_current_settings(update.effective_chat.id)
+    await get_async_db().update_mark_reviewed_after_categorized(
         update.effective_chat.id, not settings.mark_reviewed_after_categorized
     )
 
     await update.callback_query.answer()
     await update.callback_query.edit_message_text(
-        text=get_transactions_handling_text(update.effective_chat.id),
+        text=await get_transactions_handling_text(update.effective_chat.id),
         reply_markup=get_transactions_handling_buttons(settings),
         parse_mode=ParseMode.MARKDOWN_V2,
     )
@@ -97,14 +99,14 @@ async def handle_btn_toggle_mark_reviewed_after_categorized(
 async def handle_btn_toggle_auto_categorize_after_notes(
     update: Update, _: ContextTypes.DEFAULT_TYPE
 ):
-    settings = get_db().get_current_settings(update.effective_chat.id)
-    get_db().update_auto_categorize_after_notes(
+    settings = await get_async_db().get_current_settings(update.effective_chat.id)
+    await get_async_db().update_auto_categorize_after_notes(
         update.effective_chat.id, not settings.auto_categorize_after_notes
     )
 
     await update.callback_query.answer()
     await update.callback_query.edit_message_text(
-        text=get_transactions_handling_text(update.effective_chat.id),
+        text=await get_transactions_handling_text(update.effective_chat.id),
         reply_markup=get_transactions_handling_buttons(settings),
         parse_mode=ParseMode.MARKDOWN_V2,
     )
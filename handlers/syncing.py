@@ -1,10 +1,16 @@
+from collections import defaultdict
 from datetime import timedelta
 import logging
 from telegram import Update
 from telegram.ext import ContextTypes
 
-from lunch import get_lunch_client_for_chat_id
-from persistence import get_db
+from lunch import (
+    cache_transactions,
+    get_async_lunch_client_for_chat_id,
+    stream_transaction_mirror,
+)
+from persistence import get_async_db
+from rate_limiter import BACKGROUND, priority_lane
 from tx_messaging import send_transaction_message
 
 logger = logging.getLogger("messaging")
@@ -18,8 +24,8 @@ async def handle_resync(update: Update, context: ContextTypes.DEFAULT_TYPE):
         last_n_days = int(parts[1])
 
     chat_id = update.effective_chat.id
-    lunch = get_lunch_client_for_chat_id(chat_id)
-    chat_txs = get_db().get_all_tx_by_chat_id(chat_id)
+    lunch = await get_async_lunch_client_for_chat_id(chat_id)
+    chat_txs = await get_async_db().get_all_tx_by_chat_id(chat_id)
 
     # get the created_at bounds (i.e. the earliest and latest tx)
     earliest_tx_date = min(chat_txs, key=lambda tx: tx.created_at).created_at.replace(
@@ -33,53 +39,58 @@ async def handle_resync(update: Update, context: ContextTypes.DEFAULT_TYPE):
     if last_n_days:
         earliest_tx_date = latest_tx_date - timedelta(days=last_n_days)
 
-    # get the txs within the bounds
-    logger.info(
-        f"Pulling transactions from lunch for range {earliest_tx_date} - {latest_tx_date}"
-    )
-    lunch_txs = lunch.get_transactions(
-        start_date=earliest_tx_date, end_date=latest_tx_date
-    )
+    # resyncing can take many requests, so it must not get in the way of button presses
+    with priority_lane(BACKGROUND):
+        # get the txs within the bounds
+        logger.info(
+            f"Pulling transactions from lunch for range {earliest_tx_date} - {latest_tx_date}"
+        )
+        # now we use the information in this the tx from lunch to update the tx in the db
+        # and if we miss any, we will query them individually later on
+        if last_n_days:
+            chat_txs = [tx for tx in chat_txs if tx.created_at >= earliest_tx_date]
 
-    # make a lookup map for the txs from lunch
-    lunch_txs_map = {tx.id: tx for tx in lunch_txs}
+        # the messages of each transaction that are still to be resynced
+        unsynced = defaultdict(list)
+        for tx in chat_txs:
+            unsynced[tx.tx_id].append(tx)
 
-    # now we use the information in this the tx from lunch to update the tx in the db
-    # and if we miss any, we will query them individually later on
-    if last_n_days:
-        chat_txs = [tx for tx in chat_txs if tx.created_at >= earliest_tx_date]
+        errors = 0
+        missing = 0
+        # transactions are streamed, so big ranges are never held in memory at once
+        async for lunch_tx in stream_transaction_mirror(
+            chat_id, earliest_tx_date, latest_tx_date
+        ):
+            for tx in unsynced.pop(lunch_tx.id, []):
+                # for each transaction we must find the message that holds its information
+                # and update it to reflect the new information, if any
+                try:
+                    await send_transaction_message(
+                        context, lunch_tx, chat_id, tx.message_id
+                    )
 
-    errors = 0
-    missing = 0
-    for tx in chat_txs:
-        if tx.tx_id in lunch_txs_map:
-            lunch_tx = lunch_txs_map[tx.tx_id]
-            # for each transaction we must find the message that holds its information
-            # and update it to reflect the new information, if any
-            try:
-                await send_transaction_message(
-                    context, lunch_tx, chat_id, tx.message_id
-                )
+                    # update the tx in the db
+                    if lunch_tx.status == "cleared":
+                        await get_async_db().mark_as_reviewed(tx.message_id, chat_id)
+                    else:
+                        await get_async_db().mark_as_unreviewed(tx.message_id, chat_id)
+                except Exception as e:
+                    logger.error(
+                        f"Error sending transaction message for tx_id {tx.tx_id}: {e}"
+                    )
+                    errors += 1
 
-                # update the tx in the db
-                if lunch_tx.status == "cleared":
-                    get_db().mark_as_reviewed(tx.message_id, chat_id)
-                else:
-                    get_db().mark_as_unreviewed(tx.message_id, chat_id)
-            except Exception as e:
-                logger.error(
-                    f"Error sending transaction message for tx_id {tx.tx_id}: {e}"
-                )
-                errors += 1
-        else:
-            try:
-                lunch_tx = lunch.get_transaction(tx.tx_id)
-                await send_transaction_message(
-                    context, lunch_tx, chat_id, tx.message_id
-                )
-            except Exception as e:
-                logger.error(f"Error fetching transaction {tx.tx_id}: {e}")
-                missing += 1
+        for txs in unsynced.values():
+            for tx in txs:
+                try:
+                    lunch_tx = await lunch.get_transaction(tx.tx_id)
+                    cache_transactions(chat_id, [lunch_tx])
+                    await send_transaction_message(
+                        context, lunch_tx, chat_id, tx.message_id
+                    )
+                except Exception as e:
+                    logger.error(f"Error fetching transaction {tx.tx_id}: {e}")
+                    missing += 1
 
     logger.info(
         f"Resynced {len(chat_txs) - errors - missing} transactions, {errors} errors, {missing} missing"
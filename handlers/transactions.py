@@ -1,3 +1,4 @@
+import asyncio
 from datetime import datetime, timedelta
 import logging
 from textwrap import dedent
@@ -16,11 +17,25 @@ from handlers.expectations import (
     set_expectation,
 )
 from handlers.general import handle_generic_message
-from lunch import get_lunch_client_for_chat_id
-from lunchable.models import TransactionObject
+from lunch import (
+    MIRROR_FRESH_SECS,
+    fetch_transactions,
+    get_categories_async,
+    get_recent_transactions,
+    get_transaction_async,
+    update_transaction_async,
+)
 
-from persistence import get_db
-from tx_messaging import get_tx_buttons, send_plaid_details, send_transaction_message
+from persistence import get_async_db
+from rate_limiter import BACKGROUND, priority_lane
+from transaction_records import TransactionRecord
+from tx_messaging import (
+    apply_transaction_update,
+    get_tx_buttons_by_id,
+    optimistic_updates_enabled,
+    send_plaid_details,
+    send_transaction_message,
+)
 from utils import Keyboard, ensure_token, find_related_tx
 
 logger = logging.getLogger("tx_handler")
@@ -28,7 +43,7 @@ logger = logging.getLogger("tx_handler")
 
 async def check_posted_transactions_and_telegram_them(
     context: ContextTypes.DEFAULT_TYPE, chat_id: int
-) -> List[TransactionObject]:
+) -> List[TransactionRecord]:
     # get date from 30 days ago
     two_weeks_ago = datetime.now().replace(
         hour=0, minute=0, second=0, microsecond=0
@@ -36,25 +51,34 @@ async def check_posted_transactions_and_telegram_them(
     now = datetime.now().replace(hour=0, minute=0, second=0, microsecond=0)
     logger.info(f"Polling for new transactions from {two_weeks_ago} to {now}...")
 
-    lunch = get_lunch_client_for_chat_id(chat_id)
-    transactions = lunch.get_transactions(
-        status="uncleared",
-        pending=False,
-        start_date=two_weeks_ago,
-        end_date=now,
+    # only the unreviewed ones, filtered by Lunch Money; the pending poll and
+    # /resync sync the whole range into the mirror
+    transactions = await fetch_transactions(
+        chat_id, two_weeks_ago, now, status="uncleared", pending=False
     )
 
     logger.info(f"Found {len(transactions)} unreviewed transactions for chat {chat_id}")
 
-    settings = get_db().get_current_settings(chat_id)
-    for transaction in transactions:
-        if settings.auto_mark_reviewed:
-            lunch.update_transaction(
-                transaction.id, TransactionUpdateObject(status="cleared")
-            )
+    settings = await get_async_db().get_current_settings(chat_id)
+    if settings.auto_mark_reviewed:
+        await asyncio.gather(
+            *[
+                update_transaction_async(
+                    chat_id, transaction.id, TransactionUpdateObject(status="cleared")
+                )
+                for transaction in transactions
+            ]
+        )
+        for transaction in transactions:
             transaction.status = "cleared"
 
-        if get_db().was_already_sent(transaction.id):
+    # looked up once for the whole list, instead of once per transaction
+    tx_ids = [transaction.id for transaction in transactions]
+    already_sent = await get_async_db().get_sent_tx_ids(tx_ids)
+    message_ids = await get_async_db().get_message_ids_associated_with(tx_ids, chat_id)
+
+    for transaction in transactions:
+        if transaction.id in already_sent:
             logger.debug(
                 f"Skipping already sent transaction {transaction.id} in chat {chat_id}"
             )
@@ -68,14 +92,13 @@ async def check_posted_transactions_and_telegram_them(
             logger.info(
                 f"Found related transaction {related_tx.id} for {transaction.id}"
             )
-            reply_msg_id = get_db().get_message_id_associated_with(
-                related_tx.id, chat_id
-            )
+            reply_msg_id = message_ids.get(related_tx.id)
 
         msg_id = await send_transaction_message(
-            context, transaction, chat_id, reply_to_message_id=reply_msg_id
+            context, transaction.to_model(), chat_id, reply_to_message_id=reply_msg_id
         )
-        get_db().mark_as_sent(
+        message_ids[transaction.id] = msg_id
+        await get_async_db().mark_as_sent(
             transaction.id,
             chat_id,
             msg_id,
@@ -93,7 +116,10 @@ async def check_posted_transactions_and_telegram_them(
 async def check_pending_transactions_and_telegram_them(
     context: ContextTypes.DEFAULT_TYPE,
     chat_id: int,
-) -> List[TransactionObject]:
+    max_mirror_age_secs: float = 0,
+) -> List[TransactionRecord]:
+    """Sends the pending transactions not sent yet. They are read from the
+    transaction mirror if it was synced in the last max_mirror_age_secs."""
     # get date from 15 days ago
     two_weeks_ago = datetime.now().replace(
         hour=0, minute=0, second=0, microsecond=0
@@ -101,21 +127,25 @@ async def check_pending_transactions_and_telegram_them(
     now = datetime.now().replace(hour=0, minute=0, second=0, microsecond=0)
     logger.info(f"Polling for new transactions from {two_weeks_ago} to {now}...")
 
-    lunch = get_lunch_client_for_chat_id(chat_id)
-    transactions = lunch.get_transactions(
-        pending=True, start_date=two_weeks_ago, end_date=now
+    transactions = await get_recent_transactions(
+        chat_id, two_weeks_ago, now, max_mirror_age_secs, pending=True
     )
     logger.info(f"Found {len(transactions)} pending transactions")
-    transactions = [tx for tx in transactions if tx.is_pending and tx.notes is None]
+    transactions = [tx for tx in transactions if tx.notes is None]
 
     logger.info(f"Found {len(transactions)} pending transactions")
 
+    already_sent = await get_async_db().get_sent_tx_ids(
+        [transaction.id for transaction in transactions], pending=True
+    )
     for transaction in transactions:
-        if get_db().was_already_sent(transaction.id, pending=True):
+        if transaction.id in already_sent:
             logger.info(f"Skipping already sent pending transaction {transaction.id}")
             continue
-        msg_id = await send_transaction_message(context, transaction, chat_id)
-        get_db().mark_as_sent(
+        msg_id = await send_transaction_message(
+            context, transaction.to_model(), chat_id
+        )
+        await get_async_db().mark_as_sent(
             transaction.id,
             chat_id,
             msg_id,
@@ -134,7 +164,7 @@ async def check_pending_transactions_and_telegram_them(
 async def handle_check_transactions(
     update: Update, context: ContextTypes.DEFAULT_TYPE
 ) -> None:
-    settings = ensure_token(update)
+    settings = await ensure_token(update)
 
     if settings.poll_pending:
         transactions = await check_pending_transactions_and_telegram_them(
@@ -145,7 +175,9 @@ async def handle_check_transactions(
             context, chat_id=update.message.chat_id
         )
 
-    get_db().update_last_poll_at(update.effective_chat.id, datetime.now().isoformat())
+    await get_async_db().update_last_poll_at(
+        update.effective_chat.id, datetime.now().isoformat()
+    )
 
     if not transactions:
         await update.message.reply_text("No unreviewed transactions found.")
@@ -155,9 +187,11 @@ async def handle_check_transactions(
 async def check_pending_transactions(
     update: Update, context: ContextTypes.DEFAULT_TYPE
 ) -> None:
+    # the poll job keeps the mirror fresh, so the command usually reads it
     transactions = await check_pending_transactions_and_telegram_them(
         context,
         chat_id=update.effective_chat.id,
+        max_mirror_age_secs=MIRROR_FRESH_SECS,
     )
 
     if not transactions:
@@ -175,7 +209,7 @@ async def handle_btn_skip_transaction(update: Update, _: ContextTypes.DEFAULT_TY
 
 async def handle_btn_collapse_transaction(update: Update, _: ContextTypes.DEFAULT_TYPE):
     await update.callback_query.edit_message_reply_markup(
-        reply_markup=get_tx_buttons(
+        reply_markup=await get_tx_buttons_by_id(
             int(update.callback_query.data.split("_")[1]), collapsed=True
         )
     )
@@ -187,7 +221,9 @@ async def handle_btn_cancel_categorization(
 ):
     query = update.callback_query
     transaction_id = int(query.data.split("_")[1])
-    await query.edit_message_reply_markup(reply_markup=get_tx_buttons(transaction_id))
+    await query.edit_message_reply_markup(
+        reply_markup=await get_tx_buttons_by_id(transaction_id)
+    )
     await query.answer()
 
 
@@ -195,10 +231,9 @@ async def handle_btn_show_categories(update: Update, _: ContextTypes.DEFAULT_TYP
     """Updates the message to show the parent categories available"""
     query = update.callback_query
     chat_id = query.message.chat.id
-    lunch = get_lunch_client_for_chat_id(chat_id)
     transaction_id = int(query.data.split("_")[1])
 
-    categories = lunch.get_categories()
+    categories = await get_categories_async(chat_id)
     kbd = Keyboard()
     for category in categories:
         if category.group_id is None:
@@ -222,8 +257,7 @@ async def handle_btn_show_subcategories(update: Update, _: ContextTypes.DEFAULT_
     transaction_id, category_id = query.data.split("_")[1:]
 
     chat_id = query.message.chat.id
-    lunch = get_lunch_client_for_chat_id(chat_id)
-    subcategories = lunch.get_categories()
+    subcategories = await get_categories_async(chat_id)
     kbd = Keyboard()
     for subcategory in subcategories:
         if str(subcategory.group_id) == str(category_id):
@@ -243,26 +277,27 @@ async def handle_btn_apply_category(update: Update, context: ContextTypes.DEFAUL
     chat_id = query.message.chat.id
 
     transaction_id, category_id = query.data.split("_")[1:]
-    lunch = get_lunch_client_for_chat_id(chat_id)
 
-    settings = get_db().get_current_settings(chat_id)
+    categories = None
+    if optimistic_updates_enabled():
+        # needed to render the category names before Lunch Money does
+        categories = await get_categories_async(chat_id)
+
+    settings = await get_async_db().get_current_settings(chat_id)
     if settings.mark_reviewed_after_categorized:
-        lunch.update_transaction(
-            transaction_id,
-            TransactionUpdateObject(category_id=category_id, status="cleared"),
-        )
-        get_db().mark_as_reviewed(query.message.message_id, chat_id)
+        tx_update = TransactionUpdateObject(category_id=category_id, status="cleared")
     else:
-        lunch.update_transaction(
-            transaction_id,
-            TransactionUpdateObject(category_id=category_id),
-        )
-    logger.info(f"Changed category for tx {transaction_id} to {category_id}")
+        tx_update = TransactionUpdateObject(category_id=category_id)
 
-    updated_transaction = lunch.get_transaction(transaction_id)
-    await send_transaction_message(
-        context, updated_transaction, chat_id, query.message.message_id
+    await apply_transaction_update(
+        context,
+        chat_id,
+        transaction_id,
+        tx_update,
+        query.message.message_id,
+        categories=categories,
     )
+    logger.info(f"Changed category for tx {transaction_id} to {category_id}")
     await query.answer()
 
 
@@ -274,9 +309,8 @@ async def handle_btn_dump_plaid_details(
     transaction_id = int(query.data.split("_")[1])
 
     chat_id = query.message.chat.id
-    lunch = get_lunch_client_for_chat_id(chat_id)
 
-    transaction = lunch.get_transaction(transaction_id)
+    transaction = await get_transaction_async(chat_id, transaction_id)
     plaid_metadata = transaction.plaid_metadata
     plaid_details = "*Plaid Metadata*\n\n"
     plaid_details += f"*Transaction ID:* {transaction_id}\n"
@@ -294,21 +328,19 @@ async def handle_btn_mark_tx_as_reviewed(
     """Updates the transaction status to reviewed."""
     query = update.callback_query
     chat_id = query.message.chat.id
-    lunch = get_lunch_client_for_chat_id(chat_id)
     transaction_id = int(query.data.split("_")[1])
     try:
-        lunch.update_transaction(
-            transaction_id, TransactionUpdateObject(status="cleared")
-        )
-
         # update message to show the right buttons
-        updated_tx = lunch.get_transaction(transaction_id)
-        msg_id = get_db().get_message_id_associated_with(transaction_id, chat_id)
-        await send_transaction_message(
-            context, transaction=updated_tx, chat_id=chat_id, message_id=msg_id
+        msg_id = await get_async_db().get_message_id_associated_with(
+            transaction_id, chat_id
+        )
+        await apply_transaction_update(
+            context,
+            chat_id,
+            transaction_id,
+            TransactionUpdateObject(status="cleared"),
+            msg_id,
         )
-
-        get_db().mark_as_reviewed(query.message.message_id, chat_id)
         await query.answer()
     except Exception as e:
         await query.answer(
@@ -322,22 +354,20 @@ async def handle_btn_mark_tx_as_unreviewed(
     """Updates the transaction status to unreviewed."""
     query = update.callback_query
     chat_id = query.message.chat.id
-    lunch = get_lunch_client_for_chat_id(chat_id)
     transaction_id = int(query.data.split("_")[1])
     try:
         logger.info(f"Marking transaction {transaction_id} as unreviewed")
-        lunch.update_transaction(
-            transaction_id, TransactionUpdateObject(status="uncleared")
-        )
-
         # update message to show the right buttons
-        updated_tx = lunch.get_transaction(transaction_id)
-        msg_id = get_db().get_message_id_associated_with(transaction_id, chat_id)
-        await send_transaction_message(
-            context, transaction=updated_tx, chat_id=chat_id, message_id=msg_id
+        msg_id = await get_async_db().get_message_id_associated_with(
+            transaction_id, chat_id
+        )
+        await apply_transaction_update(
+            context,
+            chat_id,
+            transaction_id,
+            TransactionUpdateObject(status="uncleared"),
+            msg_id,
         )
-
-        get_db().mark_as_unreviewed(query.message.message_id, chat_id)
         await query.answer()
     except Exception as e:
         await query.answer(
@@ -355,7 +385,9 @@ async def handle_set_tx_notes_or_tags(
         return
 
     replying_to_msg_id = update.message.reply_to_message.message_id
-    tx_id = get_db().get_tx_associated_with(replying_to_msg_id, update.message.chat_id)
+    tx_id = await get_async_db().get_tx_associated_with(
+        replying_to_msg_id, update.message.chat_id
+    )
 
     if tx_id is None:
         logger.error("No transaction ID found in bot data", exc_info=True)
@@ -377,32 +409,26 @@ async def handle_set_tx_notes_or_tags(
             message_are_tags = False
             break
 
-    lunch = get_lunch_client_for_chat_id(update.message.chat_id)
+    chat_id = update.message.chat_id
     if message_are_tags:
         tags_without_hashtag = [
             tag[1:] for tag in msg_text.split(" ") if tag.startswith("#")
         ]
         logger.info(f"Setting tags to transaction ({tx_id}): {tags_without_hashtag}")
-        lunch.update_transaction(
-            tx_id, TransactionUpdateObject(tags=tags_without_hashtag)
-        )
+        tx_update = TransactionUpdateObject(tags=tags_without_hashtag)
     else:
         notes = msg_text
         if len(notes) > 350:
             notes = notes[:350]
         logger.info(f"Setting notes to transaction ({tx_id}): {notes}")
-        lunch.update_transaction(tx_id, TransactionUpdateObject(notes=notes))
+        tx_update = TransactionUpdateObject(notes=notes)
 
     # update the transaction message to show the new notes
-    updated_tx = lunch.get_transaction(tx_id)
-    await send_transaction_message(
-        context,
-        transaction=updated_tx,
-        chat_id=update.message.chat_id,
-        message_id=replying_to_msg_id,
+    await apply_transaction_update(
+        context, chat_id, tx_id, tx_update, replying_to_msg_id
     )
 
-    settings = get_db().get_current_settings(update.message.chat_id)
+    settings = await get_async_db().get_current_settings(update.message.chat_id)
     if settings.auto_categorize_after_notes and not message_are_tags:
         await ai_categorize_transaction(tx_id, update.message.chat_id, context)
 
@@ -418,15 +444,14 @@ async def handle_btn_ai_categorize(update: Update, context: ContextTypes.DEFAULT
     tx_id = int(query.data.split("_")[1])
 
     chat_id = query.message.chat.id
-    response = auto_categorize(tx_id, chat_id)
+    response = await asyncio.to_thread(auto_categorize, tx_id, chat_id)
     await update.callback_query.answer(
         text=response,
         show_alert=True,
     )
 
     # update the transaction message to show the new notes
-    lunch = get_lunch_client_for_chat_id(chat_id)
-    updated_tx = lunch.get_transaction(tx_id)
+    updated_tx = await get_transaction_async(chat_id, tx_id)
     await send_transaction_message(
         context,
         transaction=updated_tx,
@@ -441,12 +466,12 @@ async def poll_transactions_on_schedule(context: ContextTypes.DEFAULT_TYPE):
     However, each chat can have its own polling settings, so we use this
     function to check the settings for each chat and decide whether to poll.
     """
-    chat_ids = get_db().get_all_registered_chats()
+    chat_ids = await get_async_db().get_all_registered_chats()
     if len(chat_ids) is None:
         logger.info("No chats registered yet")
 
     for chat_id in chat_ids:
-        settings = get_db().get_current_settings(chat_id)
+        settings = await get_async_db().get_current_settings(chat_id)
         if not settings:
             # technically this should never happen, but just in case
             logger.error(f"No settings found for chat {chat_id}!")
@@ -466,22 +491,26 @@ async def poll_transactions_on_schedule(context: ContextTypes.DEFAULT_TYPE):
             should_poll = datetime.now() >= next_poll_at
 
         if should_poll:
-            if settings.poll_pending:
-                await check_pending_transactions_and_telegram_them(
-                    context, chat_id=chat_id
-                )
-            else:
-                await check_posted_transactions_and_telegram_them(
-                    context, chat_id=chat_id
-                )
-            get_db().update_last_poll_at(chat_id, datetime.now().isoformat())
+            # scheduled polls must not delay the requests of button presses
+            with priority_lane(BACKGROUND):
+                if settings.poll_pending:
+                    await check_pending_transactions_and_telegram_them(
+                        context, chat_id=chat_id
+                    )
+                else:
+                    await check_posted_transactions_and_telegram_them(
+                        context, chat_id=chat_id
+                    )
+            await get_async_db().update_last_poll_at(
+                chat_id, datetime.now().isoformat()
+            )
 
 
 async def handle_expand_tx_options(update: Update, _: ContextTypes.DEFAULT_TYPE):
     transaction_id = int(update.callback_query.data.split("_")[1])
     await update.callback_query.answer()
     await update.callback_query.edit_message_reply_markup(
-        reply_markup=get_tx_buttons(transaction_id, collapsed=False)
+        reply_markup=await get_tx_buttons_by_id(transaction_id, collapsed=False)
     )
 
 
@@ -494,7 +523,7 @@ async def handle_rename_payee(update: Update, context: ContextTypes.DEFAULT_TYPE
         reply_to_message_id=update.callback_query.message.message_id,
         reply_markup=ForceReply(),
     )
-    set_expectation(
+    await set_expectation(
         update.effective_chat.id,
         {
             "expectation": RENAME_PAYEE,
@@ -518,7 +547,7 @@ async def handle_edit_notes(update: Update, context: ContextTypes.DEFAULT_TYPE):
         parse_mode=ParseMode.MARKDOWN,
         reply_markup=ForceReply(),
     )
-    set_expectation(
+    await set_expectation(
         update.effective_chat.id,
         {
             "expectation": EDIT_NOTES,
@@ -544,7 +573,7 @@ async def handle_set_tags(update: Update, context: ContextTypes.DEFAULT_TYPE):
         parse_mode=ParseMode.MARKDOWN,
         reply_markup=ForceReply(),
     )
-    set_expectation(
+    await set_expectation(
         update.effective_chat.id,
         {
             "expectation": SET_TAGS,
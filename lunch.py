@@ -1,15 +1,541 @@
-from typing import Dict
-from lunchable import LunchMoney
+import asyncio
+import json
+import logging
+import os
+import threading
+import time
+from datetime import date, datetime, timezone
+from typing import (
+    Any,
+    AsyncIterator,
+    Awaitable,
+    Callable,
+    Dict,
+    Hashable,
+    List,
+    Optional,
+    Tuple,
+    Union,
+)
+import httpx
+from lunchable import LunchMoney, TransactionUpdateObject
+from lunchable._config import APIConfig
+from lunchable.exceptions import LunchMoneyHTTPError
+from lunchable.models import (
+    AssetsObject,
+    BudgetObject,
+    CategoriesObject,
+    CryptoObject,
+    PlaidAccountObject,
+    TagsObject,
+    TransactionObject,
+)
+from lunchable.models._core import LunchMoneyAPIClient, LunchMoneyAsyncClient
+from lunchable.models.budgets import BudgetParamsGet
+from lunchable.models.transactions import _TransactionParamsGet, _TransactionsResponse
+import pydantic_core
+from urllib.parse import urlsplit
 
+from api_metrics import lunch_api_metrics
+from cassettes import through_cassette, through_cassette_async
 from errors import NoLunchToken
-from persistence import get_db
+from events import (
+    CategoriesChanged,
+    TokenChanged,
+    TransactionUpdated,
+    publish,
+    subscribe,
+)
+from persistence import MirroredTransaction, get_async_db, get_db
+from rate_limiter import RateLimiter, backoff_delay, parse_retry_after
+from transaction_records import TransactionRecord, decode_transactions_page
 
+logger = logging.getLogger("lunch")
+
+# lets the bot talk to a stand-in for Lunch Money, like fake_lunch.py
+if os.getenv("LUNCH_MONEY_API_URL"):
+    api_url = urlsplit(os.getenv("LUNCH_MONEY_API_URL"))
+    APIConfig.LUNCHMONEY_SCHEME = api_url.scheme
+    APIConfig.LUNCHMONEY_NETLOC = api_url.netloc
+    logger.warning(f"Using the Lunch Money API at {api_url.geturl()}")
 
 lunch_clients_cache: Dict[int, LunchMoney] = {}
+async_lunch_clients_cache: Dict[int, "AsyncLunchClient"] = {}
+
+# the event loop the asyncio clients run on; the client caches are only
+# changed from it (see _call_on_clients_loop)
+clients_loop: Optional[asyncio.AbstractEventLoop] = None
+
+# chat_id -> tx_id -> (transaction, time it was fetched)
+transactions_cache: Dict[int, Dict[int, Tuple[TransactionObject, float]]] = {}
+
+# how long a cached transaction is trusted before asking Lunch Money again
+TRANSACTION_CACHE_TTL_SECS = 10 * 60
+
+# how recently the mirror must have been synced for get_recent_transactions
+# to read it instead of Lunch Money
+MIRROR_FRESH_SECS = 2 * 60
+MAX_CACHED_TRANSACTIONS_PER_CHAT = 1000
+
+# page size and prefetched pages of AsyncLunchClient.iter_transactions
+TRANSACTIONS_PAGE_SIZE = 250
+TRANSACTIONS_LOOK_AHEAD_PAGES = 2
+
+# (token, start date, end date) -> (budgets, time they were fetched)
+budgets_cache: Dict[Tuple[str, str, str], Tuple[List[BudgetObject], float]] = {}
+
+# closed months only change if old transactions are edited, so they are kept
+# much longer than the current month, which changes with every transaction
+PAST_MONTH_BUDGET_TTL_SECS = 6 * 60 * 60
+CURRENT_MONTH_BUDGET_TTL_SECS = 2 * 60
+
+# chat_id -> (categories, time they were fetched)
+categories_cache: Dict[int, Tuple[List[CategoriesObject], float]] = {}
+
+# categories rarely change, and when they do CategoriesChanged evicts them
+CATEGORIES_CACHE_TTL_SECS = 30 * 60
+
+# fields of a TransactionUpdateObject that can be applied to a cached
+# transaction as-is; others (e.g. category_id, tags) change values that
+# Lunch Money derives server-side, like category and tag names
+LOCALLY_APPLICABLE_FIELDS = {"payee", "notes", "status"}
+
+
+class _InFlightCall:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result: Any = None
+        self.error: Optional[BaseException] = None
+
+
+class SingleFlight:
+    """Lets identical concurrent calls share a single in-flight call and its result."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls: Dict[Hashable, _InFlightCall] = {}
+
+    def do(self, key: Hashable, fn: Callable[[], Any]) -> Tuple[Any, bool]:
+        """Runs fn, or waits for the identical call already running.
+        Returns the result and whether it was shared with another caller."""
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = _InFlightCall()
+                self._calls[key] = call
+
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result, True
+
+        try:
+            call.result = fn()
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+        return call.result, False
+
+
+class AsyncSingleFlight:
+    """asyncio counterpart of SingleFlight.
+
+    The shared call runs in its own task, so cancelling any caller, including
+    the one that started it, does not cancel it for the others."""
+
+    def __init__(self):
+        self._calls: Dict[Hashable, asyncio.Task] = {}
+
+    async def do(
+        self, key: Hashable, fn: Callable[[], Awaitable[Any]]
+    ) -> Tuple[Any, bool]:
+        call = self._calls.get(key)
+        if call is not None:
+            return await asyncio.shield(call), True
+
+        call = asyncio.ensure_future(fn())
+        self._calls[key] = call
+
+        def on_done(task: asyncio.Task) -> None:
+            if self._calls.get(key) is task:
+                del self._calls[key]
+            if not task.cancelled():
+                # mark it as retrieved, there may be no caller left to see it
+                task.exception()
+
+        call.add_done_callback(on_done)
+        return await asyncio.shield(call), False
+
+
+lunch_singleflight = SingleFlight()
+lunch_async_singleflight = AsyncSingleFlight()
+
+# Lunch Money does not document its limits, so these are conservative defaults
+lunch_rate_limiter = RateLimiter(
+    rate_per_key=float(os.getenv("LUNCH_MONEY_RATE_PER_TOKEN", "5")),
+    burst_per_key=float(os.getenv("LUNCH_MONEY_BURST_PER_TOKEN", "10")),
+    global_rate=float(os.getenv("LUNCH_MONEY_GLOBAL_RATE", "20")),
+    global_burst=float(os.getenv("LUNCH_MONEY_GLOBAL_BURST", "40")),
+)
+LUNCH_MAX_RETRIES = int(os.getenv("LUNCH_MONEY_MAX_RETRIES", "4"))
+
+
+def _coalescing_key(access_token: str, url: str, params: Any) -> Hashable:
+    return (
+        access_token,
+        url,
+        json.dumps(pydantic_core.to_jsonable_python(params), sort_keys=True),
+    )
+
+
+def _retry_sleep(
+    access_token: str, method: str, url: Any, response: httpx.Response, attempt: int
+) -> Optional[float]:
+    """Returns how long to sleep before retrying the response, or None if it
+    must be returned to the caller."""
+    if response.status_code == 429:
+        # a rejected request was not applied, so any method can be retried
+        delay = parse_retry_after(response.headers.get("Retry-After"))
+        if delay is None:
+            delay = backoff_delay(attempt)
+        # every request for this token must back off, not just this one, so
+        # the rate limiter does the waiting
+        lunch_rate_limiter.block(access_token, delay)
+        logger.warning(f"{method} {url} was rate limited for {delay:.1f}s")
+        return 0.0
+    if response.status_code >= 500 and method == LunchMoneyAPIClient.Methods.GET:
+        delay = backoff_delay(attempt)
+        logger.warning(
+            f"{method} {url} failed with {response.status_code}, "
+            f"retrying in {delay:.1f}s"
+        )
+        return delay
+    return None
+
+
+class LunchClient(LunchMoney):
+    """LunchMoney client that:
+
+    - coalesces identical concurrent GET requests for the same token
+    - rate limits requests per token and globally
+    - retries rate limited requests honoring Retry-After, and GET requests
+      that failed with a transport or server error, with jittered backoff
+    - records the count, errors and latency of every round trip"""
+
+    def request(self, method: str, url: Any, **kwargs: Any) -> httpx.Response:
+        attempt = 0
+        while True:
+            waited = lunch_rate_limiter.acquire(self.access_token)
+            if waited > 1:
+                logger.info(f"Waited {waited:.1f}s for the rate limiter")
+
+            started_at = time.monotonic()
+            try:
+                response = through_cassette(
+                    "lunch",
+                    method,
+                    url,
+                    lambda: super(LunchClient, self).request(method, url, **kwargs),
+                    params=kwargs.get("params"),
+                    body=kwargs.get("content"),
+                )
+            except httpx.TransportError as e:
+                lunch_api_metrics.record(
+                    method, url, time.monotonic() - started_at, error=True
+                )
+                if method != self.Methods.GET or attempt >= LUNCH_MAX_RETRIES:
+                    raise
+                delay = backoff_delay(attempt)
+                logger.warning(f"{method} {url} failed: {e}, retrying in {delay:.1f}s")
+                time.sleep(delay)
+                attempt += 1
+                continue
+
+            lunch_api_metrics.record(
+                method,
+                url,
+                time.monotonic() - started_at,
+                error=response.status_code >= 400,
+            )
+            sleep = _retry_sleep(self.access_token, method, url, response, attempt)
+            if sleep is None or attempt >= LUNCH_MAX_RETRIES:
+                return response
+            time.sleep(sleep)
+            attempt += 1
+
+    def make_request(
+        self,
+        method: str,
+        url_path: Any,
+        params: Optional[Dict[str, Any]] = None,
+        payload: Optional[Any] = None,
+        **kwargs: Any,
+    ) -> Any:
+        if method != self.Methods.GET or payload is not None or kwargs:
+            return super().make_request(method, url_path, params, payload, **kwargs)
+
+        url = APIConfig.make_url(url_path=url_path)
+        result, shared = lunch_singleflight.do(
+            _coalescing_key(self.access_token, url, params),
+            lambda: super(LunchClient, self).make_request(method, url_path, params),
+        )
+        if shared:
+            logger.debug(f"Coalesced in-flight request to {url}")
+            get_db().inc_metric("lunch_coalesced_requests")
+        return result
+
+
+def _decode_transaction_records(
+    response: httpx.Response,
+) -> Tuple[List[TransactionRecord], bool]:
+    """Same checks as process_response, decoding the page into TransactionRecords."""
+    if response.is_success:
+        try:
+            return decode_transactions_page(response.content)
+        except (KeyError, TypeError, ValueError):
+            # not a page of transactions, e.g. an error payload
+            pass
+    LunchMoneyAPIClient.process_response(response)
+    raise LunchMoneyHTTPError(f"Unexpected transactions response: {response.text}")
+
+
+class AsyncLunchClient:
+    """asyncio client for the Lunch Money endpoints on the hot paths: polling,
+    transaction buttons, budgets and balances.
+
+    Returns the same lunchable models as LunchClient, and shares its rate
+    limiter, coalescing and retries, without tying up a thread per request."""
+
+    Methods = LunchMoneyAPIClient.Methods
+
+    def __init__(self, access_token: str):
+        self.access_token = access_token
+        self.session = LunchMoneyAsyncClient(access_token=access_token)
+
+    async def aclose(self) -> None:
+        await self.session.aclose()
+
+    async def __aenter__(self) -> "AsyncLunchClient":
+        return self
+
+    async def __aexit__(self, *_: Any) -> None:
+        await self.aclose()
+
+    async def request(self, method: str, url: Any, **kwargs: Any) -> httpx.Response:
+        attempt = 0
+        while True:
+            waited = await lunch_rate_limiter.acquire_async(self.access_token)
+            if waited > 1:
+                logger.info(f"Waited {waited:.1f}s for the rate limiter")
+
+            started_at = time.monotonic()
+            try:
+                response = await through_cassette_async(
+                    "lunch",
+                    method,
+                    url,
+                    lambda: self.session.request(method, url, **kwargs),
+                    params=kwargs.get("params"),
+                    body=kwargs.get("content"),
+                )
+            except httpx.TransportError as e:
+                lunch_api_metrics.record(
+                    method, url, time.monotonic() - started_at, error=True
+                )
+                if method != self.Methods.GET or attempt >= LUNCH_MAX_RETRIES:
+                    raise
+                delay = backoff_delay(attempt)
+                logger.warning(f"{method} {url} failed: {e}, retrying in {delay:.1f}s")
+                await asyncio.sleep(delay)
+                attempt += 1
+                continue
+
+            lunch_api_metrics.record(
+                method,
+                url,
+                time.monotonic() - started_at,
+                error=response.status_code >= 400,
+            )
+            sleep = _retry_sleep(self.access_token, method, url, response, attempt)
+            if sleep is None or attempt >= LUNCH_MAX_RETRIES:
+                return response
+            await asyncio.sleep(sleep)
+            attempt += 1
+
+    async def make_request(
+        self,
+        method: str,
+        url_path: Any,
+        params: Optional[Dict[str, Any]] = None,
+        payload: Optional[Any] = None,
+        decode: Callable[[httpx.Response], Any] = LunchMoneyAPIClient.process_response,
+    ) -> Any:
+        url = APIConfig.make_url(url_path=url_path)
+        params = pydantic_core.to_jsonable_python(params)
+
+        async def send() -> Any:
+            response = await self.request(
+                method,
+                url,
+                params=params,
+                content=pydantic_core.to_json(payload) if payload else None,
+            )
+            return decode(response)
+
+        if method != self.Methods.GET or payload is not None:
+            return await send()
+
+        result, shared = await lunch_async_singleflight.do(
+            (decode.__name__, _coalescing_key(self.access_token, url, params)), send
+        )
+        if shared:
+            logger.debug(f"Coalesced in-flight request to {url}")
+            get_db().inc_metric("lunch_coalesced_requests")
+        return result
+
+    async def _get_transactions_page(
+        self, search_params: Dict[str, Any], fast: bool = False
+    ) -> Tuple[List[Any], bool]:
+        if fast:
+            return await self.make_request(
+                self.Methods.GET,
+                APIConfig.LUNCHMONEY_TRANSACTIONS,
+                params=search_params,
+                decode=_decode_transaction_records,
+            )
+        response = _TransactionsResponse.model_validate(
+            await self.make_request(
+                self.Methods.GET,
+                APIConfig.LUNCHMONEY_TRANSACTIONS,
+                params=search_params,
+            )
+        )
+        return response.transactions, response.has_more
+
+    async def iter_transactions(
+        self,
+        start_date: Optional[Any] = None,
+        end_date: Optional[Any] = None,
+        status: Optional[str] = None,
+        pending: Optional[bool] = None,
+        page_size: int = TRANSACTIONS_PAGE_SIZE,
+        look_ahead: int = TRANSACTIONS_LOOK_AHEAD_PAGES,
+        fast: bool = False,
+    ) -> AsyncIterator[Union[TransactionObject, TransactionRecord]]:
+        """Yields the transactions in the range as their pages arrive.
+
+        Pages are fetched in the background, at most look_ahead pages ahead
+        of the consumer, so memory use does not grow with the range.
+
+        With fast, yields TransactionRecords instead of lunchable models."""
+        search_params = _TransactionParamsGet(
+            start_date=start_date,
+            end_date=end_date,
+            status=status,
+            pending=pending,
+            offset=0,
+            limit=page_size,
+        ).model_dump(exclude_none=True)
+        pages: asyncio.Queue = asyncio.Queue(maxsize=max(1, look_ahead))
+
+        async def fetch_pages():
+            try:
+                while True:
+                    page, has_more = await self._get_transactions_page(
+                        dict(search_params), fast
+                    )
+                    await pages.put(page)
+                    if not has_more or not page:
+                        break
+                    search_params["offset"] += len(page)
+            except Exception as e:
+                await pages.put(e)
+                return
+            await pages.put(None)
+
+        fetcher = asyncio.create_task(fetch_pages())
+        try:
+            while True:
+                page = await pages.get()
+                if page is None:
+                    return
+                if isinstance(page, Exception):
+                    raise page
+                for transaction in page:
+                    yield transaction
+        finally:
+            fetcher.cancel()
+
+    async def get_transaction(self, transaction_id: int) -> TransactionObject:
+        response = await self.make_request(
+            self.Methods.GET, [APIConfig.LUNCHMONEY_TRANSACTIONS, transaction_id]
+        )
+        return TransactionObject.model_validate(response)
+
+    async def update_transaction(
+        self, transaction_id: int, transaction: TransactionUpdateObject
+    ) -> Dict[str, Any]:
+        return await self.make_request(
+            self.Methods.PUT,
+            [APIConfig.LUNCHMONEY_TRANSACTIONS, transaction_id],
+            payload={"transaction": transaction.model_dump(exclude_unset=True)},
+        )
+
+    async def get_categories(self) -> List[CategoriesObject]:
+        response = await self.make_request(
+            self.Methods.GET, APIConfig.LUNCHMONEY_CATEGORIES
+        )
+        return [CategoriesObject.model_validate(c) for c in response["categories"]]
+
+    async def get_category(self, category_id: int) -> CategoriesObject:
+        response = await self.make_request(
+            self.Methods.GET, [APIConfig.LUNCHMONEY_CATEGORIES, category_id]
+        )
+        return CategoriesObject.model_validate(response)
+
+    async def get_budgets(self, start_date: Any, end_date: Any) -> List[BudgetObject]:
+        response = await self.make_request(
+            self.Methods.GET,
+            APIConfig.LUNCHMONEY_BUDGET,
+            params=BudgetParamsGet(
+                start_date=start_date, end_date=end_date
+            ).model_dump(),
+        )
+        return [BudgetObject.model_validate(b) for b in response]
+
+    async def get_assets(self) -> List[AssetsObject]:
+        response = await self.make_request(
+            self.Methods.GET, APIConfig.LUNCHMONEY_ASSETS
+        )
+        return [AssetsObject.model_validate(a) for a in response["assets"]]
+
+    async def get_plaid_accounts(self) -> List[PlaidAccountObject]:
+        response = await self.make_request(
+            self.Methods.GET, APIConfig.LUNCHMONEY_PLAID_ACCOUNTS
+        )
+        return [
+            PlaidAccountObject.model_validate(a) for a in response["plaid_accounts"]
+        ]
+
+    async def get_crypto(self) -> List[CryptoObject]:
+        response = await self.make_request(
+            self.Methods.GET, APIConfig.LUNCHMONEY_CRYPTO
+        )
+        return [CryptoObject.model_validate(c) for c in response["crypto"]]
 
 
 def get_lunch_client(token: str) -> LunchMoney:
-    return LunchMoney(access_token=token)
+    return LunchClient(access_token=token)
+
+
+def get_async_lunch_client(token: str) -> AsyncLunchClient:
+    return AsyncLunchClient(access_token=token)
 
 
 def get_lunch_client_for_chat_id(chat_id: int) -> LunchMoney:
@@ -22,3 +548,529 @@ def get_lunch_client_for_chat_id(chat_id: int) -> LunchMoney:
 
     lunch_clients_cache[chat_id] = get_lunch_client(token)
     return lunch_clients_cache[chat_id]
+
+
+def cache_async_lunch_client(chat_id: int, token: str) -> AsyncLunchClient:
+    """Builds the chat's asyncio client from a token that is already known,
+    e.g. when warming up, so handlers don't have to read it."""
+    async_lunch_clients_cache[chat_id] = get_async_lunch_client(token)
+    return async_lunch_clients_cache[chat_id]
+
+
+async def get_async_lunch_client_for_chat_id(chat_id: int) -> AsyncLunchClient:
+    global clients_loop
+    clients_loop = asyncio.get_running_loop()
+    if chat_id in async_lunch_clients_cache:
+        return async_lunch_clients_cache[chat_id]
+
+    token = await get_async_db().get_token(chat_id)
+    if token is None:
+        raise NoLunchToken("No token registered for this chat")
+
+    return cache_async_lunch_client(chat_id, token)
+
+
+def _remember_transaction(
+    chat_id: int, transaction: TransactionObject, fetched_at: float
+) -> None:
+    chat_cache = transactions_cache.setdefault(chat_id, {})
+    # re-insert so the dict order reflects freshness
+    chat_cache.pop(transaction.id, None)
+    chat_cache[transaction.id] = (transaction, fetched_at)
+
+    while len(chat_cache) > MAX_CACHED_TRANSACTIONS_PER_CHAT:
+        chat_cache.pop(next(iter(chat_cache)))
+
+
+def _mirror_row(
+    transaction: Union[TransactionObject, TransactionRecord]
+) -> Dict[str, Any]:
+    updated_at = transaction.updated_at
+    if updated_at is not None and updated_at.tzinfo is not None:
+        updated_at = updated_at.astimezone(timezone.utc).replace(tzinfo=None)
+    return {
+        "tx_id": transaction.id,
+        "date": _as_datetime(transaction.date),
+        "status": transaction.status,
+        "is_pending": bool(transaction.is_pending),
+        "payee": transaction.payee,
+        "amount": transaction.amount,
+        "category_id": transaction.category_id,
+        "lunch_updated_at": updated_at,
+        # always the lunchable model's JSON, whichever path fetched it, so
+        # rows compare equal when the transaction did not change
+        "data": (
+            transaction.to_model().model_dump_json()
+            if isinstance(transaction, TransactionRecord)
+            else transaction.model_dump_json()
+        ),
+    }
+
+
+def _as_datetime(day: date) -> datetime:
+    if isinstance(day, datetime):
+        return day
+    return datetime.combine(day, datetime.min.time())
+
+
+def _from_mirror(mirrored: MirroredTransaction) -> TransactionObject:
+    return TransactionObject.model_validate_json(mirrored.data)
+
+
+def cache_transactions(
+    chat_id: int, transactions: List[TransactionObject], mirror: bool = True
+) -> None:
+    """Stores freshly fetched transactions so handlers can re-render them,
+    and copies them to the chat's transaction mirror unless mirror is False,
+    e.g. for optimistic copies Lunch Money has not confirmed yet."""
+    now = time.monotonic()
+    for transaction in transactions:
+        _remember_transaction(chat_id, transaction, now)
+    if not mirror:
+        return
+    get_async_db().defer(
+        get_db().mirror_transactions,
+        chat_id,
+        [_mirror_row(transaction) for transaction in transactions],
+    )
+
+
+def evict_transaction(chat_id: int, tx_id: int) -> None:
+    transactions_cache.get(chat_id, {}).pop(tx_id, None)
+
+
+def _get_cached_transaction(chat_id: int, tx_id: int) -> Optional[TransactionObject]:
+    cached = transactions_cache.get(chat_id, {}).get(tx_id)
+    if cached is not None:
+        transaction, fetched_at = cached
+        if time.monotonic() - fetched_at < TRANSACTION_CACHE_TTL_SECS:
+            return transaction
+    return None
+
+
+def _get_fresh_mirrored(
+    chat_id: int, mirrored: Optional[MirroredTransaction]
+) -> Optional[TransactionObject]:
+    # the mirror outlives the in-memory cache, e.g. across restarts
+    if mirrored is None:
+        return None
+    age = (datetime.now() - mirrored.synced_at).total_seconds()
+    if age >= TRANSACTION_CACHE_TTL_SECS:
+        return None
+    transaction = _from_mirror(mirrored)
+    _remember_transaction(chat_id, transaction, time.monotonic() - age)
+    return transaction
+
+
+def get_transaction(chat_id: int, tx_id: int) -> TransactionObject:
+    """Returns the transaction from the cache or the mirror, fetching it
+    from Lunch Money if neither has a fresh enough copy."""
+    tx_id = int(tx_id)
+    transaction = _get_cached_transaction(chat_id, tx_id) or _get_fresh_mirrored(
+        chat_id, get_db().get_mirrored_transaction(chat_id, tx_id)
+    )
+    if transaction is not None:
+        return transaction
+
+    transaction = get_lunch_client_for_chat_id(chat_id).get_transaction(tx_id)
+    cache_transactions(chat_id, [transaction])
+    return transaction
+
+
+def apply_update_locally(
+    transaction: TransactionObject,
+    update: TransactionUpdateObject,
+    categories: Optional[List[CategoriesObject]] = None,
+) -> TransactionObject:
+    """Returns a copy of the transaction with the update applied, the way
+    Lunch Money is expected to apply it.
+
+    Category names can only be resolved if the categories are provided, and
+    tags get a placeholder id until the server copy is fetched."""
+    patched = transaction.model_copy(deep=True)
+    changes = update.model_dump(exclude_unset=True, mode="json")
+    for field in LOCALLY_APPLICABLE_FIELDS & set(changes):
+        setattr(patched, field, changes[field])
+
+    if "category_id" in changes:
+        category_id = changes["category_id"]
+        patched.category_id = int(category_id) if category_id is not None else None
+        by_id = {category.id: category for category in categories or []}
+        category = by_id.get(patched.category_id)
+        if category is not None:
+            group = by_id.get(category.group_id)
+            patched.category_name = category.name
+            patched.category_group_id = category.group_id
+            patched.category_group_name = group.name if group else None
+        elif patched.category_id is None:
+            patched.category_name = None
+            patched.category_group_id = None
+            patched.category_group_name = None
+
+    if "tags" in changes:
+        patched.tags = [
+            TagsObject(id=0, name=str(tag)) for tag in changes["tags"] or []
+        ]
+
+    return patched
+
+
+def update_transaction(
+    chat_id: int, tx_id: int, update: TransactionUpdateObject
+) -> Dict[str, Any]:
+    """Updates the transaction in Lunch Money and publishes TransactionUpdated,
+    which refreshes the cached copies (see _on_transaction_updated)."""
+    tx_id = int(tx_id)
+    lunch = get_lunch_client_for_chat_id(chat_id)
+    response = lunch.update_transaction(tx_id, update)
+    _publish_update(chat_id, tx_id, update, response)
+    return response
+
+
+def _publish_update(
+    chat_id: int, tx_id: int, update: TransactionUpdateObject, response: Any
+) -> None:
+    publish(
+        TransactionUpdated(
+            chat_id,
+            tx_id,
+            changes=update.model_dump(exclude_unset=True, mode="json"),
+            confirmed=isinstance(response, dict) and bool(response.get("updated")),
+        )
+    )
+
+
+async def get_transaction_async(chat_id: int, tx_id: int) -> TransactionObject:
+    """Same as get_transaction, using the asyncio client on a miss."""
+    tx_id = int(tx_id)
+    transaction = _get_cached_transaction(chat_id, tx_id) or _get_fresh_mirrored(
+        chat_id, await get_async_db().get_mirrored_transaction(chat_id, tx_id)
+    )
+    if transaction is not None:
+        return transaction
+
+    lunch = await get_async_lunch_client_for_chat_id(chat_id)
+    transaction = await lunch.get_transaction(tx_id)
+    cache_transactions(chat_id, [transaction])
+    return transaction
+
+
+async def refresh_transaction_async(chat_id: int, tx_id: int) -> TransactionObject:
+    """Fetches the transaction from Lunch Money, bypassing the cache."""
+    evict_transaction(chat_id, int(tx_id))
+    return await get_transaction_async(chat_id, tx_id)
+
+
+async def update_transaction_async(
+    chat_id: int, tx_id: int, update: TransactionUpdateObject
+) -> Dict[str, Any]:
+    """Same as update_transaction, using the asyncio client."""
+    tx_id = int(tx_id)
+    lunch = await get_async_lunch_client_for_chat_id(chat_id)
+    response = await lunch.update_transaction(tx_id, update)
+    _publish_update(chat_id, tx_id, update, response)
+    return response
+
+
+async def stream_transaction_mirror(
+    chat_id: int, start_date: date, end_date: date, fast: bool = False
+) -> AsyncIterator[Union[TransactionObject, TransactionRecord]]:
+    """Streams all of the chat's transactions in the date range, pending ones
+    included, and brings the mirror up to date with them as they go by: new
+    and changed transactions are written and, once the whole range has been
+    seen, the ones no longer in Lunch Money are removed.
+
+    With fast, yields TransactionRecords, which are not kept in the
+    in-memory cache."""
+    start_date, end_date = _as_datetime(start_date), _as_datetime(end_date)
+    lunch = await get_async_lunch_client_for_chat_id(chat_id)
+    db = get_async_db()
+    seen: List[int] = []
+    batch: List[Union[TransactionObject, TransactionRecord]] = []
+    changed = 0
+    async for transaction in lunch.iter_transactions(
+        start_date=start_date, end_date=end_date, pending=True, fast=fast
+    ):
+        if not fast:
+            _remember_transaction(chat_id, transaction, time.monotonic())
+        seen.append(transaction.id)
+        batch.append(transaction)
+        if len(batch) >= TRANSACTIONS_PAGE_SIZE:
+            changed += await db.mirror_transactions(
+                chat_id, [_mirror_row(t) for t in batch]
+            )
+            batch = []
+        yield transaction
+
+    changed += await db.mirror_transactions(chat_id, [_mirror_row(t) for t in batch])
+    removed = await db.prune_mirror(chat_id, start_date, end_date, seen)
+    await db.update_mirror_sync_state(chat_id, start_date, end_date)
+    logger.info(
+        f"Synced transaction mirror of chat {chat_id} from {start_date} to {end_date}: "
+        f"{len(seen)} transactions, {changed} new or changed, {removed} removed"
+    )
+
+
+async def fetch_transactions(
+    chat_id: int,
+    start_date: date,
+    end_date: date,
+    status: Optional[str] = None,
+    pending: Optional[bool] = None,
+) -> List[TransactionRecord]:
+    """Fetches the chat's transactions in the date range that match the
+    filters, letting Lunch Money do the filtering, and copies them to the
+    mirror. Unlike sync_transaction_mirror, it does not prune the mirror or
+    count as a sync of the range, since it only sees part of it."""
+    lunch = await get_async_lunch_client_for_chat_id(chat_id)
+    transactions = [
+        transaction
+        async for transaction in lunch.iter_transactions(
+            start_date=_as_datetime(start_date),
+            end_date=_as_datetime(end_date),
+            status=status,
+            pending=pending,
+            fast=True,
+        )
+    ]
+    await get_async_db().mirror_transactions(
+        chat_id, [_mirror_row(transaction) for transaction in transactions]
+    )
+    return transactions
+
+
+async def sync_transaction_mirror(
+    chat_id: int, start_date: date, end_date: date, fast: bool = False
+) -> List[Union[TransactionObject, TransactionRecord]]:
+    """Same as stream_transaction_mirror, returning the transactions as a list."""
+    return [
+        tx
+        async for tx in stream_transaction_mirror(chat_id, start_date, end_date, fast)
+    ]
+
+
+async def get_mirrored_transactions(
+    chat_id: int,
+    start_date: date,
+    end_date: date,
+    status: Optional[str] = None,
+    pending: Optional[bool] = None,
+    payee: Optional[str] = None,
+    category_id: Optional[int] = None,
+    fast: bool = False,
+) -> List[Union[TransactionObject, TransactionRecord]]:
+    """Returns the chat's transactions in the date range from the local mirror,
+    newest first, without calling Lunch Money. With fast, returns
+    TransactionRecords, like stream_transaction_mirror.
+
+    The mirror is eventually consistent: it reflects what the bot last fetched
+    or changed, so edits made elsewhere only show up after the next sync (see
+    get_mirror_synced_at)."""
+    mirrored = await get_async_db().get_mirrored_transactions(
+        chat_id,
+        _as_datetime(start_date),
+        _as_datetime(end_date),
+        status=status,
+        is_pending=pending,
+        payee=payee,
+        category_id=category_id,
+    )
+    if fast:
+        return [TransactionRecord.from_json(m.data) for m in mirrored]
+    return [_from_mirror(m) for m in mirrored]
+
+
+async def get_mirror_synced_at(
+    chat_id: int, start_date: Optional[date] = None, end_date: Optional[date] = None
+) -> Optional[datetime]:
+    """When the chat's mirror was last synced with Lunch Money, if ever. Given a
+    date range, only counts a last sync that covered all of it."""
+    state = await get_async_db().get_mirror_sync_state(chat_id)
+    if state is None or state.last_synced_at is None:
+        return None
+    if start_date is not None and state.synced_from > _as_datetime(start_date):
+        return None
+    if end_date is not None and state.synced_to < _as_datetime(end_date):
+        return None
+    return state.last_synced_at
+
+
+async def get_recent_transactions(
+    chat_id: int,
+    start_date: date,
+    end_date: date,
+    max_mirror_age_secs: float = MIRROR_FRESH_SECS,
+    pending: Optional[bool] = None,
+) -> List[TransactionRecord]:
+    """Returns the chat's transactions in the date range, read from the mirror
+    if it was synced for the whole range in the last max_mirror_age_secs, and
+    synced from Lunch Money otherwise."""
+    synced_at = await get_mirror_synced_at(chat_id, start_date, end_date)
+    if synced_at is not None and (
+        (datetime.now() - synced_at).total_seconds() < max_mirror_age_secs
+    ):
+        logger.info(f"Reading transactions of chat {chat_id} from the mirror")
+        return await get_mirrored_transactions(
+            chat_id, start_date, end_date, pending=pending, fast=True
+        )
+
+    transactions = await sync_transaction_mirror(chat_id, start_date, end_date, fast=True)
+    if pending is None:
+        return transactions
+    return [tx for tx in transactions if tx.is_pending == pending]
+
+
+def budget_ttl(end_date: date) -> float:
+    if isinstance(end_date, datetime):
+        end_date = end_date.date()
+    if end_date < date.today():
+        return PAST_MONTH_BUDGET_TTL_SECS
+    return CURRENT_MONTH_BUDGET_TTL_SECS
+
+
+def _evict_budgets(token: str, day: Optional[date] = None) -> None:
+    """Evicts the token's cached budgets, only the ones covering the day if given."""
+    day = day.strftime("%Y-%m-%d") if day is not None else None
+    for key in list(budgets_cache):
+        budget_token, start_date, end_date = key
+        if budget_token == token and (day is None or start_date <= day <= end_date):
+            budgets_cache.pop(key, None)
+
+
+async def get_budgets_async(
+    chat_id: int, start_date: date, end_date: date
+) -> List[BudgetObject]:
+    """Returns the budgets for the range, from the cache if they are fresh enough."""
+    lunch = await get_async_lunch_client_for_chat_id(chat_id)
+    key = (
+        lunch.access_token,
+        start_date.strftime("%Y-%m-%d"),
+        end_date.strftime("%Y-%m-%d"),
+    )
+    now = time.monotonic()
+    cached = budgets_cache.get(key)
+    if cached is not None:
+        budgets, fetched_at = cached
+        if now - fetched_at < budget_ttl(end_date):
+            return budgets
+
+    budgets = await lunch.get_budgets(start_date=start_date, end_date=end_date)
+    budgets_cache[key] = (budgets, time.monotonic())
+
+    # drop whatever expired, so months nobody looks at again do not pile up
+    for stale_key, (_, fetched_at) in list(budgets_cache.items()):
+        if now - fetched_at >= PAST_MONTH_BUDGET_TTL_SECS:
+            budgets_cache.pop(stale_key, None)
+    return budgets
+
+
+async def get_categories_async(chat_id: int) -> List[CategoriesObject]:
+    """Returns the chat's categories, from the cache if they are fresh enough."""
+    cached = categories_cache.get(chat_id)
+    if cached is not None:
+        categories, fetched_at = cached
+        if time.monotonic() - fetched_at < CATEGORIES_CACHE_TTL_SECS:
+            return categories
+
+    lunch = await get_async_lunch_client_for_chat_id(chat_id)
+    categories = await lunch.get_categories()
+    categories_cache[chat_id] = (categories, time.monotonic())
+    return categories
+
+
+def _cached_token(chat_id: int) -> Optional[str]:
+    for clients in (async_lunch_clients_cache, lunch_clients_cache):
+        if chat_id in clients:
+            return clients[chat_id].access_token
+    return None
+
+
+def _call_on_clients_loop(fn: Callable[..., None], *args: Any) -> None:
+    """Calls fn on the clients' event loop: right away if already on it (or
+    if there is none yet), scheduled from any other thread."""
+    loop = clients_loop
+    try:
+        running = asyncio.get_running_loop()
+    except RuntimeError:
+        running = None
+    if loop is None or loop is running or loop.is_closed():
+        fn(*args)
+    else:
+        loop.call_soon_threadsafe(fn, *args)
+
+
+def _evict_chat_clients(chat_id: int) -> None:
+    """Drops the chat's clients and what was cached with its token, and closes
+    the connections of its asyncio client. Runs on the clients' event loop."""
+    token = _cached_token(chat_id)
+    if token is not None:
+        _evict_budgets(token)
+    lunch_clients_cache.pop(chat_id, None)
+    async_lunch = async_lunch_clients_cache.pop(chat_id, None)
+    transactions_cache.pop(chat_id, None)
+    categories_cache.pop(chat_id, None)
+    if async_lunch is not None and clients_loop and not clients_loop.is_closed():
+        clients_loop.create_task(async_lunch.aclose())
+
+
+@subscribe(TokenChanged)
+def _on_token_changed(event: TokenChanged) -> None:
+    # published from the database thread too, so the caches the event loop
+    # reads are changed on the loop
+    _call_on_clients_loop(_evict_chat_clients, event.chat_id)
+    # the new token may belong to a different Lunch Money account
+    get_async_db().defer(get_db().delete_mirror_for_chat, event.chat_id)
+
+
+def _patch_mirrored_transaction(
+    chat_id: int, tx_id: int, changes: Dict[str, Any]
+) -> None:
+    """Applies the changes to the mirrored copy. Runs on the database thread."""
+    db = get_db()
+    mirrored = db.get_mirrored_transaction(chat_id, tx_id)
+    if mirrored is None:
+        return
+    transaction = _from_mirror(mirrored)
+    for field, value in changes.items():
+        setattr(transaction, field, value)
+    db.mirror_transactions(chat_id, [_mirror_row(transaction)])
+
+
+@subscribe(TransactionUpdated)
+def _on_transaction_updated(event: TransactionUpdated) -> None:
+    """Lunch Money only acknowledges updates, so fields that can be applied
+    locally are patched into the cached and mirrored transaction; any other
+    change evicts them so the next read goes to the API. The mirror is
+    written on the database thread, without waiting for it."""
+    chat_id, tx_id, changes = event.chat_id, event.tx_id, event.changes
+    cached = transactions_cache.get(chat_id, {}).get(tx_id)
+    transaction = cached[0] if cached is not None else None
+
+    token = _cached_token(chat_id)
+    if "category_id" in changes and token is not None:
+        # spending moved between categories in the budgets of that month,
+        # which is unknown if the transaction is not in memory
+        _evict_budgets(token, transaction.date if transaction is not None else None)
+
+    async_db = get_async_db()
+    if not (event.confirmed and set(changes).issubset(LOCALLY_APPLICABLE_FIELDS)):
+        evict_transaction(chat_id, tx_id)
+        async_db.defer(get_db().evict_mirrored_transaction, chat_id, tx_id)
+        return
+
+    if transaction is None:
+        async_db.defer(_patch_mirrored_transaction, chat_id, tx_id, changes)
+        return
+    for field, value in changes.items():
+        setattr(transaction, field, value)
+    async_db.defer(get_db().mirror_transactions, chat_id, [_mirror_row(transaction)])
+
+
+@subscribe(CategoriesChanged)
+def _on_categories_changed(event: CategoriesChanged) -> None:
+    categories_cache.pop(event.chat_id, None)
+    # budgets and transactions carry category names
+    transactions_cache.pop(event.chat_id, None)
+    token = _cached_token(event.chat_id)
+    if token is not None:
+        _evict_budgets(token)
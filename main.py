@@ -16,6 +16,7 @@ from telegram.ext import (
 )
 
 
+from api_metrics import track_handler
 from handlers.amz import (
     handle_amazon_sync,
     handle_process_amazon_transactions,
@@ -63,7 +64,9 @@ from handlers.transactions import (
     handle_set_tx_notes_or_tags,
     poll_transactions_on_schedule,
 )
+from maintenance import COMPACTION_INTERVAL_SECS, compact_database
 from manual_tx import handle_manual_tx, handle_web_app_data
+from persistence import get_async_db
 from handlers.settings.schedule_rendering import (
     handle_btn_cancel_poll_interval_change,
     handle_btn_change_poll_interval,
@@ -92,6 +95,7 @@ from handlers.settings.general import (
     handle_settings,
     handle_settings_menu,
 )
+from warmup import warm_up_caches
 from web_server import run_web_server, update_bot_status, set_bot_instance
 from handlers.analytics import handle_stats, handle_status
 
@@ -308,7 +312,12 @@ def setup_handlers(config):
 
     app.add_error_handler(handle_errors)
 
-    app.job_queue.run_repeating(poll_transactions_on_schedule, interval=60, first=5)
+    app.job_queue.run_repeating(
+        track_handler(poll_transactions_on_schedule), interval=60, first=5
+    )
+    app.job_queue.run_repeating(
+        track_handler(compact_database), interval=COMPACTION_INTERVAL_SECS, first=600
+    )
 
     app.add_handler(
         MessageHandler(filters.TEXT & filters.REPLY, handle_set_tx_notes_or_tags)
@@ -319,6 +328,11 @@ def setup_handlers(config):
         MessageHandler(filters.StatusUpdate.WEB_APP_DATA, handle_web_app_data)
     )
 
+    # attribute the Lunch Money calls each handler makes to it, see /stats
+    for handlers in app.handlers.values():
+        for handler in handlers:
+            handler.callback = track_handler(handler.callback)
+
     logger.info("Telegram handlers set up successfully")
 
     return app
@@ -332,6 +346,7 @@ def load_config():
         "PROMPT_FOR_NOTES": os.getenv("PROMPT_FOR_NOTES", "true").lower() == "true",
         "PROMPT_FOR_CATEGORIES": os.getenv("PROMPT_FOR_CATEGORIES", "true").lower()
         == "true",
+        "WARM_UP_CACHES": os.getenv("WARM_UP_CACHES", "true").lower() == "true",
     }
 
 
@@ -391,13 +406,22 @@ async def main():
         # Start the web server
         runner = await run_web_server()
 
+        # in the background, so updates are answered while caches fill up
+        warm_up = None
+        if config["WARM_UP_CACHES"]:
+            warm_up = asyncio.create_task(track_handler(warm_up_caches)())
+
         try:
             await stop_signal.wait()
         finally:
             update_bot_status(False)  # Mark as stopped during cleanup
+            if warm_up is not None:
+                warm_up.cancel()
             await runner.cleanup()
             await app.updater.stop()
             await app.stop()
+            # let the writes queued on the database thread land
+            await asyncio.to_thread(get_async_db().shutdown)
 
 
 if __name__ == "__main__":
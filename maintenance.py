@@ -0,0 +1,26 @@
+import logging
+import os
+
+from telegram.ext import ContextTypes
+
+from persistence import get_async_db
+
+logger = logging.getLogger("maintenance")
+
+# rows of sent messages older than this are pruned, 0 keeps them forever
+TRANSACTIONS_RETENTION_DAYS = int(os.getenv("TRANSACTIONS_RETENTION_DAYS", "365"))
+
+# how often the database is compacted
+COMPACTION_INTERVAL_SECS = 6 * 60 * 60
+
+
+async def compact_database(_: ContextTypes.DEFAULT_TYPE) -> None:
+    """Prunes old transaction rows and vacuums the free pages. Runs on the
+    database thread, queued behind the writes of the handlers."""
+    pruned, reclaimed = await get_async_db().compact(
+        TRANSACTIONS_RETENTION_DAYS or None
+    )
+    logger.info(
+        f"Compacted the database: pruned {pruned} transaction rows, "
+        f"reclaimed {reclaimed / (1024 * 1024):.2f} MB"
+    )
@@ -1,3 +1,4 @@
+import asyncio
 import json
 import logging
 import os
@@ -10,8 +11,12 @@ from telegram.ext import (
 from telegram.constants import ParseMode
 import datetime
 
-from lunch import get_lunch_client_for_chat_id
-from persistence import get_db
+from lunch import (
+    get_async_lunch_client_for_chat_id,
+    get_lunch_client_for_chat_id,
+    get_transaction_async,
+)
+from persistence import get_async_db
 from tx_messaging import send_transaction_message
 
 logger = logging.getLogger("manual_tx")
@@ -46,10 +51,13 @@ async def do_save_transaction(
     if tx_data["is_received"]:
         tx_data["amount"] = tx_data["amount"] * -1
 
-    lunch = get_lunch_client_for_chat_id(update.effective_chat.id)
+    lunch = await asyncio.to_thread(
+        get_lunch_client_for_chat_id, update.effective_chat.id
+    )
 
     # get currency for this type of account
-    assets = lunch.get_assets()
+    async_lunch = await get_async_lunch_client_for_chat_id(update.effective_chat.id)
+    assets = await async_lunch.get_assets()
     account = next(
         (asset for asset in assets if asset.id == int(tx_data["account_id"])), None
     )
@@ -58,7 +66,9 @@ async def do_save_transaction(
 
     logger.info(f"Transaction data: {tx_data}")
 
-    tx_ids = lunch.insert_transactions(
+    # the sync client may wait on the rate limiter, so keep it off the event loop
+    tx_ids = await asyncio.to_thread(
+        lunch.insert_transactions,
         TransactionInsertObject(
             date=datetime.datetime.strptime(tx_data["date"], "%Y-%m-%d"),
             category_id=tx_data["category_id"],
@@ -68,12 +78,12 @@ async def do_save_transaction(
             notes=tx_data.get("notes", None),
             status="cleared",
             asset_id=int(tx_data["account_id"]),
-        )
+        ),
     )
 
     # poll the transaction we just created
     [transaction_id] = tx_ids
-    transaction = lunch.get_transaction(transaction_id)
+    transaction = await get_transaction_async(update.effective_chat.id, transaction_id)
 
     logger.info(f"Transaction saved: {transaction}")
 
@@ -82,7 +92,7 @@ async def do_save_transaction(
         transaction=transaction,
         chat_id=update.effective_chat.id,
     )
-    get_db().mark_as_sent(
+    await get_async_db().mark_as_sent(
         transaction.id,
         update.effective_chat.id,
         msg_id,
@@ -94,10 +104,10 @@ async def do_save_transaction(
 
 async def handle_manual_tx(update: Update, _: ContextTypes.DEFAULT_TYPE) -> None:
     chat_id = update.effective_chat.id
-    lunch = get_lunch_client_for_chat_id(chat_id)
+    lunch = await get_async_lunch_client_for_chat_id(chat_id)
 
     # Check for manually managed accounts
-    assets = lunch.get_assets()
+    assets = await lunch.get_assets()
     manual_accounts = [
         asset
         for asset in assets
@@ -0,0 +1,173 @@
+import asyncio
+import random
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from email.utils import parsedate_to_datetime
+from datetime import datetime, timezone
+from typing import Dict, Optional
+
+# Priority lanes. Interactive requests (button presses, commands) always get
+# the next available token before background ones (polling, bulk syncs).
+INTERACTIVE = "interactive"
+BACKGROUND = "background"
+
+request_priority: ContextVar[str] = ContextVar("request_priority", default=INTERACTIVE)
+
+
+@contextmanager
+def priority_lane(priority: str):
+    """Runs the enclosed requests in the given priority lane."""
+    reset_token = request_priority.set(priority)
+    try:
+        yield
+    finally:
+        request_priority.reset(reset_token)
+
+
+class TokenBucket:
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated_at = time.monotonic()
+        # set when the server told us to back off (e.g. Retry-After)
+        self.blocked_until = 0.0
+
+    def refill(self, now: float) -> None:
+        elapsed = now - self.updated_at
+        self.tokens = min(self.capacity, self.tokens + elapsed * self.rate)
+        self.updated_at = now
+
+    def wait_time(self, now: float) -> float:
+        """Seconds until a token is available (0 if one is available now)."""
+        wait = max(0.0, self.blocked_until - now)
+        if self.tokens < 1:
+            wait = max(wait, (1 - self.tokens) / self.rate)
+        return wait
+
+
+class RateLimiter:
+    """Token-bucket rate limiter with one bucket per key plus a global bucket
+    shared by all keys.
+
+    Callers block in acquire(), or await acquire_async(), until both buckets
+    have a token. Background callers also hold back while an interactive
+    caller is waiting for the same key, or for the global tokens left."""
+
+    def __init__(
+        self,
+        rate_per_key: float,
+        burst_per_key: float,
+        global_rate: float,
+        global_burst: float,
+    ):
+        self.rate_per_key = rate_per_key
+        self.burst_per_key = burst_per_key
+        self._cond = threading.Condition()
+        self._global = TokenBucket(global_rate, global_burst)
+        self._buckets: Dict[str, TokenBucket] = {}
+        # key -> number of interactive callers waiting for a token
+        self._interactive_waiting: Dict[str, int] = {}
+
+    def _bucket_for(self, key: str) -> TokenBucket:
+        bucket = self._buckets.get(key)
+        if bucket is None:
+            bucket = TokenBucket(self.rate_per_key, self.burst_per_key)
+            self._buckets[key] = bucket
+        return bucket
+
+    def _must_yield(self, key: str) -> bool:
+        if self._interactive_waiting.get(key, 0) > 0:
+            return True
+        waiting = sum(self._interactive_waiting.values())
+        return waiting > 0 and self._global.tokens < waiting + 1
+
+    def _enter(self, key: str, priority: str) -> None:
+        if priority == INTERACTIVE:
+            self._interactive_waiting[key] = self._interactive_waiting.get(key, 0) + 1
+
+    def _leave(self, key: str, priority: str) -> None:
+        if priority == INTERACTIVE:
+            self._interactive_waiting[key] -= 1
+            if self._interactive_waiting[key] == 0:
+                del self._interactive_waiting[key]
+            self._cond.notify_all()
+
+    def _try_take(self, key: str, priority: str) -> float:
+        """Takes a token if one is available. Returns 0 if it did, or else how
+        long to wait before trying again."""
+        now = time.monotonic()
+        bucket = self._bucket_for(key)
+        bucket.refill(now)
+        self._global.refill(now)
+        wait = max(bucket.wait_time(now), self._global.wait_time(now))
+        yielding = priority == BACKGROUND and self._must_yield(key)
+        if wait == 0 and not yielding:
+            bucket.tokens -= 1
+            self._global.tokens -= 1
+            return 0.0
+        # retry periodically when yielding, since the interactive caller may
+        # take the token without notifying us
+        return wait if wait > 0 else 0.05
+
+    def acquire(self, key: str, priority: Optional[str] = None) -> float:
+        """Blocks until the request may be sent. Returns the seconds waited."""
+        priority = priority or request_priority.get()
+        started_at = time.monotonic()
+        with self._cond:
+            self._enter(key, priority)
+            try:
+                while True:
+                    wait = self._try_take(key, priority)
+                    if wait == 0:
+                        return time.monotonic() - started_at
+                    self._cond.wait(timeout=wait)
+            finally:
+                self._leave(key, priority)
+
+    async def acquire_async(self, key: str, priority: Optional[str] = None) -> float:
+        """Same as acquire(), but sleeps without blocking the event loop."""
+        priority = priority or request_priority.get()
+        started_at = time.monotonic()
+        with self._cond:
+            self._enter(key, priority)
+        try:
+            while True:
+                with self._cond:
+                    wait = self._try_take(key, priority)
+                if wait == 0:
+                    return time.monotonic() - started_at
+                await asyncio.sleep(wait)
+        finally:
+            with self._cond:
+                self._leave(key, priority)
+
+    def block(self, key: str, seconds: float) -> None:
+        """Makes every caller for the key wait for the given time."""
+        with self._cond:
+            bucket = self._bucket_for(key)
+            bucket.blocked_until = max(bucket.blocked_until, time.monotonic() + seconds)
+
+
+def parse_retry_after(value: Optional[str]) -> Optional[float]:
+    """Parses a Retry-After header, which is either seconds or an HTTP date."""
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        retry_at = parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    if retry_at.tzinfo is None:
+        retry_at = retry_at.replace(tzinfo=timezone.utc)
+    return max(0.0, (retry_at - datetime.now(timezone.utc)).total_seconds())
+
+
+def backoff_delay(attempt: int, base: float = 0.5, cap: float = 30.0) -> float:
+    """Exponential backoff with full jitter."""
+    return random.uniform(0, min(cap, base * (2**attempt)))
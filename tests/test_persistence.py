@@ -0,0 +1,84 @@
+import os
+import sqlite3
+from datetime import datetime, timedelta
+
+import pytest
+
+from persistence import Persistence, Transaction
+
+
+@pytest.fixture
+def existing_db_path(tmp_path):
+    """A database created before incremental vacuum was enabled, with a year
+    of old transaction rows."""
+    path = str(tmp_path / "lonchera.db")
+    db = Persistence(path)
+    db.close()
+
+    created_at = datetime.now() - timedelta(days=400)
+    conn = sqlite3.connect(path)
+    assert conn.execute("PRAGMA auto_vacuum").fetchone()[0] == 0
+    conn.executemany(
+        "INSERT INTO transactions (message_id, tx_id, chat_id, pending, created_at, "
+        "recurring_type, plaid_id) VALUES (?, ?, 1, 0, ?, NULL, ?)",
+        [(i, i, created_at, "x" * 200) for i in range(20_000)],
+    )
+    conn.commit()
+    conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+    conn.close()
+    return path
+
+
+def disk_size(path: str) -> int:
+    wal_path = f"{path}-wal"
+    wal_size = os.path.getsize(wal_path) if os.path.exists(wal_path) else 0
+    return os.path.getsize(path) + wal_size
+
+
+def test_compact_shrinks_existing_database_on_disk(existing_db_path):
+    size_before = disk_size(existing_db_path)
+    db = Persistence(existing_db_path)
+    try:
+        pruned, reclaimed = db.compact(retention_days=365)
+        with db.Session() as session:
+            assert session.query(Transaction).count() == 0
+    finally:
+        db.close()
+
+    size_after = disk_size(existing_db_path)
+    assert pruned == 20_000
+    assert size_after < size_before / 2
+    # the one-off VACUUM must not leave a database-sized WAL behind
+    assert size_after == os.path.getsize(existing_db_path)
+    assert reclaimed >= size_before - size_after
+    assert db.compaction_stats["reclaimed_bytes"] == reclaimed
+
+
+def test_compact_reclaims_pruned_rows_incrementally(existing_db_path):
+    db = Persistence(existing_db_path)
+    try:
+        # converts to incremental vacuum and drops the old rows
+        db.compact(retention_days=365)
+        db.mark_as_sent(1, 1, 1, None)
+        with db.Session() as session:
+            session.add_all(
+                Transaction(
+                    message_id=i,
+                    tx_id=i,
+                    chat_id=1,
+                    created_at=datetime.now() - timedelta(days=400),
+                    plaid_id="x" * 200,
+                )
+                for i in range(20_000)
+            )
+            session.commit()
+        size_before = db.get_db_size()
+
+        pruned, reclaimed = db.compact(retention_days=365)
+    finally:
+        db.close()
+
+    assert pruned == 20_000
+    assert reclaimed > 0
+    assert db.get_free_bytes() == 0
+    assert db.get_db_size() == size_before - reclaimed
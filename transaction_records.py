@@ -0,0 +1,83 @@
+from datetime import date, datetime
+from typing import Any, Dict, List, Optional, Tuple
+
+import orjson
+from lunchable.models import TransactionObject
+
+# Lightweight decoding of transaction lists, for the paths that go through
+# many transactions but only look at a few fields of each, like polling.
+# Parsing uses orjson, and the full lunchable model is only validated for
+# the transactions that need it (see TransactionRecord.to_model).
+
+DECODED_FIELDS = (
+    "id",
+    "date",
+    "payee",
+    "amount",
+    "currency",
+    "status",
+    "is_pending",
+    "notes",
+    "category_id",
+    "recurring_type",
+    "plaid_account_id",
+    "asset_id",
+)
+
+
+class TransactionRecord:
+    """The fields of a transaction that the poll path reads, plus the raw API
+    payload. Any other field (plaid_metadata, tags...) is read from the raw
+    payload on access, as the API returns it."""
+
+    __slots__ = DECODED_FIELDS + ("_raw",)
+
+    def __init__(self, raw: Dict[str, Any]):
+        self.id: int = raw["id"]
+        self.date: date = date.fromisoformat(raw["date"])
+        self.payee: Optional[str] = raw.get("payee")
+        self.amount: float = float(raw["amount"])
+        self.currency: Optional[str] = raw.get("currency")
+        self.status: Optional[str] = raw.get("status")
+        self.is_pending: bool = bool(raw.get("is_pending"))
+        self.notes: Optional[str] = raw.get("notes")
+        self.category_id: Optional[int] = raw.get("category_id")
+        self.recurring_type: Optional[str] = raw.get("recurring_type")
+        self.plaid_account_id: Optional[int] = raw.get("plaid_account_id")
+        self.asset_id: Optional[int] = raw.get("asset_id")
+        self._raw = raw
+
+    def __getattr__(self, name: str) -> Any:
+        # only called for names that are not slots
+        if name == "_raw":
+            raise AttributeError(name)
+        try:
+            return self._raw[name]
+        except KeyError:
+            raise AttributeError(name) from None
+
+    def __repr__(self) -> str:
+        return f"TransactionRecord(id={self.id}, date={self.date}, payee={self.payee!r}, amount={self.amount})"
+
+    @property
+    def updated_at(self) -> Optional[datetime]:
+        value = self._raw.get("updated_at")
+        return datetime.fromisoformat(value) if value else None
+
+    def to_model(self) -> TransactionObject:
+        """Validates the full lunchable model, including any change made to
+        the record's fields (e.g. its status after marking it reviewed)."""
+        fields = {name: getattr(self, name) for name in DECODED_FIELDS}
+        return TransactionObject.model_validate({**self._raw, **fields})
+
+    @classmethod
+    def from_json(cls, data: str) -> "TransactionRecord":
+        return cls(orjson.loads(data))
+
+
+def decode_transactions_page(content: bytes) -> Tuple[List[TransactionRecord], bool]:
+    """Decodes a GET /transactions response body into records and its has_more flag."""
+    data = orjson.loads(content)
+    return [TransactionRecord(raw) for raw in data["transactions"]], bool(
+        data.get("has_more")
+    )
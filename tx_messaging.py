@@ -1,34 +1,59 @@
 from datetime import datetime
 import logging
-from typing import Optional, Union
+from typing import Dict, List, Optional, Tuple, Union
 import pytz
 import os
 
 from telegram import CallbackQuery, InlineKeyboardMarkup
 from telegram.ext import ContextTypes
 from telegram.constants import ParseMode
-from lunchable.models import TransactionObject
-
-from lunch import get_lunch_client_for_chat_id
-from persistence import get_db
+from lunchable import TransactionUpdateObject
+from lunchable.models import CategoriesObject, TransactionObject
+
+from lunch import (
+    LOCALLY_APPLICABLE_FIELDS,
+    apply_update_locally,
+    cache_transactions,
+    evict_transaction,
+    get_transaction_async,
+    refresh_transaction_async,
+    update_transaction_async,
+)
+from persistence import Transaction, get_async_db, get_db
 from utils import Keyboard, clean_md, make_tag
 
 
 logger = logging.getLogger("messaging")
 
+# fields that show up in the transaction message, used to tell whether the
+# server copy of a transaction renders differently than the optimistic one
+RENDERED_FIELDS = (
+    "payee",
+    "notes",
+    "status",
+    "category_id",
+    "category_name",
+    "category_group_name",
+)
+
+# the latest optimistic copy shown for each (chat_id, tx_id), so that a failed
+# update does not roll back over a newer one made in the meantime
+latest_optimistic: Dict[Tuple[int, int], TransactionObject] = {}
+
+
+def optimistic_updates_enabled() -> bool:
+    return os.getenv("OPTIMISTIC_UPDATES", "true").lower() == "true"
+
 
 def get_tx_buttons(
-    transaction: Union[TransactionObject, int],
+    transaction: Union[TransactionObject, Transaction],
     collapsed=True,
 ) -> InlineKeyboardMarkup:
     """Returns a list of buttons to be displayed for a transaction."""
-    # if transaction is an int, it's a transaction_id
-    if isinstance(transaction, int):
-        transaction_id = transaction
-        # assume the transaction is persisted if a transaction_id is provided
-        tx = get_db().get_tx_by_id(transaction_id)
-        if tx is None:
-            raise ValueError(f"Transaction {transaction_id} not in the database")
+    # a Transaction is the row persisted when the transaction was sent
+    if isinstance(transaction, Transaction):
+        tx = transaction
+        transaction_id = tx.tx_id
         recurring_type, is_pending, is_reviewed, plaid_id = (
             tx.recurring_type,
             tx.pending,
@@ -76,6 +101,16 @@ def get_tx_buttons(
     return kbd.build()
 
 
+async def get_tx_buttons_by_id(
+    transaction_id: int, collapsed=True
+) -> InlineKeyboardMarkup:
+    """Same as get_tx_buttons, for a transaction that was already sent."""
+    tx = await get_async_db().get_tx_by_id(transaction_id)
+    if tx is None:
+        raise ValueError(f"Transaction {transaction_id} not in the database")
+    return get_tx_buttons(tx, collapsed=collapsed)
+
+
 async def send_transaction_message(
     context: ContextTypes.DEFAULT_TYPE,
     transaction: TransactionObject,
@@ -85,7 +120,7 @@ async def send_transaction_message(
 ) -> int:
     """Sends a message to the chat_id with the details of a transaction.
     If message_id is provided, edits the existing"""
-    settings = get_db().get_current_settings(chat_id)
+    settings = await get_async_db().get_current_settings(chat_id)
     show_datetime = settings.show_datetime if settings else True
     tagging = settings.tagging if settings else True
 
@@ -217,7 +252,147 @@ async def send_plaid_details(
         reply_to_message_id=query.message.message_id,
     )
 
-    lunch = get_lunch_client_for_chat_id(chat_id)
-    transaction = lunch.get_transaction(transaction_id)
+    # the transaction was just read to build the plaid details, so this is a cache hit
+    transaction = await get_transaction_async(chat_id, transaction_id)
 
     await query.edit_message_reply_markup(reply_markup=get_tx_buttons(transaction))
+
+
+def renders_differently(a: TransactionObject, b: TransactionObject) -> bool:
+    if any(getattr(a, field) != getattr(b, field) for field in RENDERED_FIELDS):
+        return True
+    a_tags = [tag.name for tag in a.tags or []]
+    b_tags = [tag.name for tag in b.tags or []]
+    return a_tags != b_tags
+
+
+async def apply_transaction_update(
+    context: ContextTypes.DEFAULT_TYPE,
+    chat_id: int,
+    tx_id: int,
+    update: TransactionUpdateObject,
+    message_id: int,
+    categories: Optional[List[CategoriesObject]] = None,
+) -> TransactionObject:
+    """Updates a transaction and re-renders its message.
+
+    In optimistic mode the update is applied to the locally known transaction
+    and the message is edited right away, while Lunch Money is updated in the
+    background. Otherwise the message is edited once Lunch Money has the update.
+
+    A status change also marks the message as reviewed or unreviewed."""
+    tx_id = int(tx_id)
+    if not optimistic_updates_enabled():
+        await update_transaction_async(chat_id, tx_id, update)
+        await record_review_state(chat_id, message_id, update.status)
+        updated_tx = await get_transaction_async(chat_id, tx_id)
+        await send_transaction_message(context, updated_tx, chat_id, message_id)
+        return updated_tx
+
+    previous = await get_transaction_async(chat_id, tx_id)
+    optimistic = apply_update_locally(previous, update, categories)
+    # in memory only: the mirror gets the update once Lunch Money confirms it
+    cache_transactions(chat_id, [optimistic], mirror=False)
+    latest_optimistic[(chat_id, tx_id)] = optimistic
+    await record_review_state(chat_id, message_id, update.status)
+    await send_transaction_message(context, optimistic, chat_id, message_id)
+
+    context.application.create_task(
+        reconcile_transaction_update(
+            context, chat_id, tx_id, update, message_id, previous, optimistic
+        ),
+        name=f"reconcile_tx_{tx_id}",
+    )
+    return optimistic
+
+
+async def record_review_state(
+    chat_id: int, message_id: Optional[int], status: Optional[str]
+) -> None:
+    """Marks the message as reviewed if the status is cleared, or unreviewed
+    for any other status. Does nothing without a status."""
+    if status is None or message_id is None:
+        return
+    if status == "cleared":
+        await get_async_db().mark_as_reviewed(message_id, chat_id)
+    else:
+        await get_async_db().mark_as_unreviewed(message_id, chat_id)
+
+
+async def reconcile_transaction_update(
+    context: ContextTypes.DEFAULT_TYPE,
+    chat_id: int,
+    tx_id: int,
+    update: TransactionUpdateObject,
+    message_id: int,
+    previous: TransactionObject,
+    optimistic: TransactionObject,
+) -> None:
+    """Sends an optimistically rendered update to Lunch Money and fixes the
+    message if the server does not end up with what we showed."""
+    confirmed = False
+    try:
+        response = await update_transaction_async(chat_id, tx_id, update)
+        if not (isinstance(response, dict) and response.get("updated") is True):
+            raise ValueError(f"Lunch Money did not apply the update: {response}")
+        confirmed = True
+
+        changes = update.model_dump(exclude_unset=True)
+        if set(changes).issubset(LOCALLY_APPLICABLE_FIELDS):
+            # the acknowledgement is enough, nothing was derived server-side
+            return
+
+        server_tx = await refresh_transaction_async(chat_id, tx_id)
+        if latest_optimistic.get((chat_id, tx_id)) is not optimistic:
+            # a newer update is in flight and will reconcile the message itself
+            return
+        if renders_differently(server_tx, optimistic):
+            logger.info(f"Server copy of tx {tx_id} differs from optimistic one")
+            await send_transaction_message(context, server_tx, chat_id, message_id)
+    except Exception as e:
+        if confirmed:
+            # Lunch Money has the update, so the optimistic copy is not rolled
+            # back; dropping it makes the next read fetch the server copy
+            logger.exception(f"Could not reconcile update of tx {tx_id}: {e}")
+            if latest_optimistic.get((chat_id, tx_id)) is optimistic:
+                evict_transaction(chat_id, tx_id)
+            return
+        logger.error(f"Optimistic update of tx {tx_id} failed, rolling back: {e}")
+        await rollback_transaction_update(
+            context, chat_id, tx_id, update, message_id, previous, optimistic, str(e)
+        )
+    finally:
+        _forget_optimistic(chat_id, tx_id, optimistic)
+
+
+def _forget_optimistic(
+    chat_id: int, tx_id: int, optimistic: TransactionObject
+) -> None:
+    if latest_optimistic.get((chat_id, tx_id)) is optimistic:
+        del latest_optimistic[(chat_id, tx_id)]
+
+
+async def rollback_transaction_update(
+    context: ContextTypes.DEFAULT_TYPE,
+    chat_id: int,
+    tx_id: int,
+    update: TransactionUpdateObject,
+    message_id: int,
+    previous: TransactionObject,
+    optimistic: TransactionObject,
+    reason: str,
+) -> None:
+    """Restores the pre-update copy and review state, unless a newer
+    optimistic update has replaced this one, in which case that update's
+    state is left alone."""
+    if latest_optimistic.get((chat_id, tx_id)) is optimistic:
+        del latest_optimistic[(chat_id, tx_id)]
+        cache_transactions(chat_id, [previous], mirror=False)
+        if update.status is not None:
+            await record_review_state(chat_id, message_id, previous.status)
+        await send_transaction_message(context, previous, chat_id, message_id)
+    await context.bot.send_message(
+        chat_id=chat_id,
+        text=f"Could not update the transaction: {reason}",
+        reply_to_message_id=message_id,
+    )
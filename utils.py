@@ -3,7 +3,7 @@ from lunchable.models import TransactionObject
 import emoji
 from telegram import InlineKeyboardButton, InlineKeyboardMarkup, Update
 
-from persistence import Settings, get_db
+from persistence import SettingsSnapshot, get_async_db
 
 
 def is_emoji(char):
@@ -126,7 +126,7 @@ def clean_md(text: str) -> str:
     return text.replace("_", " ").replace("*", " ").replace("`", " ")
 
 
-def ensure_token(update: Update) -> Settings:
+async def ensure_token(update: Update) -> SettingsSnapshot:
     # make sure the user has registered a token by trying to get the settings
     # which will raise an exception if the token is not set
-    return get_db().get_current_settings(update.effective_chat.id)
+    return await get_async_db().get_current_settings(update.effective_chat.id)
@@ -0,0 +1,78 @@
+import asyncio
+import logging
+import time
+from datetime import datetime, timedelta
+from typing import List
+
+from errors import NoLunchToken
+from lunch import cache_async_lunch_client, get_categories_async
+from persistence import get_db
+from rate_limiter import BACKGROUND, priority_lane
+from web_server import get_bot_info
+
+logger = logging.getLogger("warmup")
+
+# chats that got or reviewed a transaction this recently get their categories prefetched
+WARM_UP_ACTIVE_DAYS = 7
+
+# how many chats have their categories fetched at the same time
+WARM_UP_CONCURRENCY = 4
+
+# the tables read by polling and by the transaction buttons
+HOT_TABLES = ["settings", "transactions", "transaction_mirror"]
+
+
+def _warm_up_db() -> List[int]:
+    """Fills the settings cache, pages in the hot tables and indexes and builds
+    the Lunch Money clients. Returns the recently active chats."""
+    db = get_db()
+    settings = db.get_all_settings()
+    indexes = db.page_in_indexes(HOT_TABLES)
+    for chat_settings in settings:
+        if chat_settings.token:
+            cache_async_lunch_client(chat_settings.chat_id, chat_settings.token)
+    logger.info(
+        f"Loaded settings and clients of {len(settings)} chats, read {indexes} indexes"
+    )
+    return db.get_recently_active_chats(
+        datetime.now() - timedelta(days=WARM_UP_ACTIVE_DAYS)
+    )
+
+
+async def _prefetch_categories(chat_id: int, semaphore: asyncio.Semaphore) -> None:
+    async with semaphore:
+        try:
+            await get_categories_async(chat_id)
+        except NoLunchToken:
+            pass
+        except Exception as e:
+            # e.g. a token that was revoked in Lunch Money
+            logger.warning(f"Could not prefetch categories for chat {chat_id}: {e}")
+
+
+async def warm_up_caches() -> None:
+    """Fills the caches that the first poll and button presses after a start
+    would otherwise fill one request at a time. Meant to run in the
+    background, while the bot is already answering."""
+    started_at = time.monotonic()
+
+    # the database calls block, so they must not hold up the event loop
+    try:
+        active_chats = await asyncio.to_thread(_warm_up_db)
+    except Exception as e:
+        logger.error(f"Could not warm up the database: {e}")
+        return
+
+    # cached by the web server for its status page
+    await get_bot_info()
+
+    semaphore = asyncio.Semaphore(WARM_UP_CONCURRENCY)
+    with priority_lane(BACKGROUND):
+        await asyncio.gather(
+            *[_prefetch_categories(chat_id, semaphore) for chat_id in active_chats]
+        )
+
+    logger.info(
+        f"Warmed up caches in {time.monotonic() - started_at:.1f}s, "
+        f"prefetched categories of {len(active_chats)} active chats"
+    )
@@ -1,3 +1,4 @@
+import asyncio
 import os
 import time
 import logging
@@ -8,8 +9,10 @@ from datetime import datetime, timedelta
 import hashlib
 from urllib.parse import unquote
 import hmac
+import html
 
-from lunch import get_lunch_client_for_chat_id
+from api_metrics import lunch_api_metrics
+from lunch import get_async_lunch_client_for_chat_id, get_categories_async
 
 # Initialize logger
 logger = logging.getLogger("web_server")
@@ -59,6 +62,8 @@ def update_bot_status(is_running: bool, error: str = ""):
 
 
 def get_db_size():
+    if os.getenv("DB_URL"):
+        return "shared database, see /status"
     db_path = os.getenv("DB_PATH", "lonchera.db")
     if os.path.exists(db_path):
         size_bytes = os.path.getsize(db_path)
@@ -169,6 +174,9 @@ async def handle_root(request):
         ai status: {ai_status}
         bot status: {bot_status_text}
         {status_details}
+
+        <strong>#lunch money api</strong>
+        {html.escape(lunch_api_metrics.summary())}
     </body>
     </html>
     """
@@ -179,10 +187,13 @@ async def handle_manual_tx_endpoint(request):
     chat_id = request.match_info.get("chat_id")
     logger.info("Serving manual tx page for chat id %s", chat_id)
 
+    lunch = await get_async_lunch_client_for_chat_id(int(chat_id))
+    assets, categories = await asyncio.gather(
+        lunch.get_assets(), get_categories_async(int(chat_id))
+    )
+
     # Generate account options
-    lunch = get_lunch_client_for_chat_id(int(chat_id))
     account_options = "<option value=''>Select account...</option>"
-    assets = lunch.get_assets()
     only_accounts = [
         asset
         for asset in assets
@@ -197,7 +208,6 @@ async def handle_manual_tx_endpoint(request):
             )
 
     # Generate category options
-    categories = lunch.get_categories()
     super_categories = [cat for cat in categories if cat.is_group]
     subcategories = [cat for cat in categories if cat.group_id is not None]
     standalone_categories = [